@@ -15,6 +15,7 @@ from server.constants import OPTIONS
 from server.constants import STRINGS
 from server.constants import PERMISSION
 
+from server.util.translator import strip_tags
 from server.util.translator import translate_to_tex
 
 logger = logging.getLogger(__name__)
@@ -73,15 +74,33 @@ def remove_corrupted_variants():
 
 def reset_variant_cache():
     logger.info('Resetting variant cache.')
+    count = model.variants.invalidate_all()
+    logger.info('Export cache of %d variants was reset.', count)
+
+
+def migration_2026_18_10_2():
+    logger.info('18.10.2026 - Adding summaries of extended songs to songbooks.')
+
+    collection = db['songbooks']
+    songbooks = collection.find()
+
+    for songbook in songbooks:
+        summary = model.variants.find_extended_songbook_items(songbook['songs'])
+        collection.update_one({'_id': songbook['_id']}, {'$set': {'summary': summary}})
+
+
+def migration_2026_18_10_1():
+    logger.info('18.10.2026 - Adding full-text search data to variants.')
+
     collection = db['variants']
     variants = collection.find()
 
     for variant in variants:
-        if not variant['export_cache']:
-            continue
+        collection.update_one({'_id': variant['_id']},
+                              {'$set': {'search.text': strip_tags(variant['text'])}})
 
-        variant['export_cache'] = None
-        collection.update_one({'_id': variant['_id']}, {'$set': variant})
+    for song in model.songs.find():
+        model.variants.update_search(song)
 
 
 def migration_2018_26_08_1():
@@ -585,3 +604,5 @@ def migration_2017_08_18_4():
 #migration_2018_12_04_1()
 #migration_2018_18_04_1()
 #migration_2018_26_08_1()
+#migration_2026_18_10_1()
+#migration_2026_18_10_2()
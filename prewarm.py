@@ -0,0 +1,18 @@
+#!./__venv__/bin/python3.6
+"""Fill empty export caches of public variants (e.g. after the cache reset or deploy)."""
+
+from flask import g
+
+from server.app import app
+from server.app import model
+from server.util.prewarm import prewarm_export_caches
+
+
+def prewarm():
+    with app.app_context():
+        g.model = model
+        prewarm_export_caches(public_only=True)
+
+
+if __name__ == '__main__':
+    prewarm()
@@ -68,8 +68,13 @@ parsed = urlsplit(app.config['MONGODB_URI'])
 mongo_client = MongoClient(app.config['MONGODB_URI'])
 db = mongo_client[parsed.path[1:]]
 
-# init model for Zpevnik application
-model = Model(db=db)
+# init model for Zpevnik application (with optional in-memory search index)
+start = time.time()
+model = Model(db=db, search=app.config['SEARCH_INDEX'])
+
+if model.search is not None:
+    logger.info('Search index of %d variants built in %.2f s.', len(model.search),
+                time.time() - start)
 
 
 @app.before_request
@@ -77,4 +82,13 @@ def before_request():
     g.model = model
 
 
+@app.teardown_request
+def teardown_request(exception):
+    # identity map of model objects lives for one request only
+    identity_map = g.pop('identity_map', None)
+    if identity_map is not None:
+        logger.debug('Identity map served %d of %d lookups.', identity_map.hits,
+                     identity_map.hits + identity_map.misses)
+
+
 from server import controllers
@@ -1,6 +1,7 @@
 """Configuration file for Zpevnik application"""
 
 from os import getenv
+from os import cpu_count
 
 VERSION = '0.3'
 APP_NAME = 'Skautský zpěvník'
@@ -20,6 +21,54 @@ XELATEX_PATH = getenv('XELATEX_PATH', '/usr/bin/xelatex')
 SONGBOOK_TEMP_FOLDER = 'songs/temp/'
 SONGBOOK_DONE_FOLDER = 'songs/done/'
 SONGBOOK_TEMPLATE_FOLDER = 'songs/templates/'
+SONGBOOK_INDEX_FOLDER = 'songs/index/'
+SONGBOOK_FORMAT_FOLDER = 'songs/formats/'
+
+# Number of translator worker processes and number of songs translated by one worker
+# at once (smaller batches are translated directly in the request)
+TRANSLATOR_WORKERS = int(getenv('TRANSLATOR_WORKERS', 2))
+TRANSLATOR_BATCH_SIZE = int(getenv('TRANSLATOR_BATCH_SIZE', 50))
+
+# Number of export worker processes (per application process)
+EXPORT_WORKERS = int(getenv('EXPORT_WORKERS', 2))
+# Seconds after which running export job without any progress is considered dead
+EXPORT_JOB_TIMEOUT = int(getenv('EXPORT_JOB_TIMEOUT', 600))
+
+# Load songbook preamble from the precompiled xelatex format (requires mylatexformat package),
+# seconds after which failed format build is tried again and days after which unused formats
+# are removed by the cleanup
+EXPORT_PRECOMPILED_FORMAT = bool(int(getenv('EXPORT_PRECOMPILED_FORMAT', 0)))
+EXPORT_FORMAT_RETRY = int(getenv('EXPORT_FORMAT_RETRY', 3600))
+EXPORT_FORMAT_AGE = int(getenv('EXPORT_FORMAT_AGE', 30))
+
+# Songbooks with at least this number of songs are compiled in chunks of songs in parallel
+# by given number of xelatex processes (0 disables the split compilation)
+EXPORT_SPLIT_SONGS = int(getenv('EXPORT_SPLIT_SONGS', 0))
+EXPORT_SPLIT_WORKERS = int(getenv('EXPORT_SPLIT_WORKERS', cpu_count() or 1))
+
+# Number of the latest exports kept in the export statistics (capped collection), number of
+# the latest exports used for the percentiles and seconds for which the summary is cached
+EXPORT_STATS_COUNT = int(getenv('EXPORT_STATS_COUNT', 10000))
+EXPORT_STATS_SAMPLE = int(getenv('EXPORT_STATS_SAMPLE', 1000))
+EXPORT_STATS_TTL = int(getenv('EXPORT_STATS_TTL', 60))
+
+# Number of worker processes filling export caches of variants (see prewarm.py), number of
+# variants processed at once and ratio of worker rest to its work (to spare the database)
+PREWARM_WORKERS = int(getenv('PREWARM_WORKERS', 2))
+PREWARM_BATCH_SIZE = int(getenv('PREWARM_BATCH_SIZE', 100))
+PREWARM_THROTTLE = float(getenv('PREWARM_THROTTLE', 1.0))
+
+# Answer song queries from the in-memory search index (built at startup). Index is updated
+# only by changes made in its own process, so it is meant for single process deployments.
+SEARCH_INDEX = bool(int(getenv('SEARCH_INDEX', 0)))
+
+# Maximal age (in seconds) of the fuzzy search indexes (changes made by other processes
+# are seen after the index is rebuilt)
+FUZZY_INDEX_TTL = int(getenv('FUZZY_INDEX_TTL', 300))
+
+# Maximal age (in seconds) of cached logged-in users (logout made through other process
+# is seen after this time, 0 disables the cache)
+USER_CACHE_TTL = int(getenv('USER_CACHE_TTL', 60))
 
 SKAUTIS = {
     'TEST': getenv('SKAUTIS_TEST', False),
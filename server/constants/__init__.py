@@ -1,5 +1,6 @@
 from server.constants.constants import EVENTS
 from server.constants.constants import EXCODES
+from server.constants.constants import JOB_STATUS
 from server.constants.constants import OPTIONS
 from server.constants.constants import ORDERING
 from server.constants.constants import PERMISSION
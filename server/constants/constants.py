@@ -26,6 +26,10 @@ class Events(ConstantDict):
 
     SONGBOOK_SONG = 'SONGBOOK SONG'
 
+    EXPORT_NEW = 'EXPORT NEW'
+    EXPORT_DONE = 'EXPORT DONE'
+    EXPORT_FAILED = 'EXPORT FAILED'
+
     CLEANUP = 'CLEANUP'
 
     BASE_EXCEPTION = 'BASE EXCEPTION'
@@ -87,6 +91,16 @@ class Tags(ConstantDict):
 TAGS = Tags()
 
 
+class JobStatus(ConstantDict):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+JOB_STATUS = JobStatus()
+
+
 class ExceptionCodes(ConstantDict):
     ALREADY_EXISTS = 'already_exists'
     DOES_NOT_EXIST = 'does_not_exist'
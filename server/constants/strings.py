@@ -29,11 +29,14 @@ class Strings(object):
     REQUEST_VARIANT_TITLE_MISSING = 'Song variant title is missing.'
     REQUEST_VARIANT_TEXT_MISSING = 'Song variant text is missing.'
     REQUEST_VARIANT_DESCRIPTION_MISSING = 'Song variant description is missing.'
+    REQUEST_VARIANT_TEXTS_MISSING = 'Song variant texts are missing.'
+    REQUEST_VARIANT_TEXTS_OOR_ERROR = 'Number of song variant texts is out of range.'
 
     REQUEST_INTERPRETER_NAME_MISSING = 'Interpreter name is missing.'
     REQUEST_AUTHOR_NAME_MISSING = 'Author name is missing.'
     REQUEST_PAGE_OOR_ERROR = 'Page number is out of range.'
     REQUEST_PER_PAGE_OOR_ERROR = 'Per page number is out of range.'
+    REQUEST_CURSOR_ERROR = 'Cursor is not valid.'
 
     REQUEST_SONGBOOK_ADD_SONG_MISSING = 'Song id is missing.'
     REQUEST_SONGBOOK_SONGS_INVALID = 'Songbook song addition request is wrong.'
@@ -46,6 +49,7 @@ class Strings(object):
     SONG_VARIANT_NOT_FOUND_ERROR = 'Song variant was not found.'
     SONGBOOK_NOT_FOUND_ERROR = 'Songbook was not found.'
     USER_NOT_FOUND_ERROR = 'User was not found.'
+    EXPORT_NOT_FOUND_ERROR = 'Export job was not found.'
 
     SONGBOOK_SONG_SUCCESS = 'Písňe ve zpěvníku byly úspěšně upraveny.'
 
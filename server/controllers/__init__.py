@@ -5,3 +5,4 @@ import server.controllers.authors
 import server.controllers.variants
 import server.controllers.songbooks
 import server.controllers.interpreters
+import server.controllers.exports
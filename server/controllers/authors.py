@@ -18,10 +18,23 @@ api = Blueprint('authors', __name__)
 @login_required
 def authors():
     if request.method == 'GET':
-        result = g.model.authors.find()
-        response = []
+        # return all authors unless paged result is requested
+        if not any(arg in request.args for arg in ('query', 'page', 'per_page', 'after', 'fuzzy')):
+            result = g.model.authors.find()
+            response = []
+            for res in result:
+                response.append(res.get_serialized_data())
+
+            return jsonify(response), 200
+
+        data = validators.handle_GET_request(request.args)
+        result, next_cursor = g.model.authors.find_special(data['query'], data['page'],
+                                                           data['per_page'], data['after'],
+                                                           data['fuzzy'])
+
+        response = {'data': [], 'next_cursor': next_cursor}
         for res in result:
-            response.append(res.get_serialized_data())
+            response['data'].append(res.get_serialized_data())
 
         return jsonify(response), 200
 
@@ -0,0 +1,68 @@
+from flask import g
+from flask import jsonify
+from flask import Blueprint
+from flask_login import current_user
+from flask_login import login_required
+
+from server.app import app
+from server.util import enqueue_export_job
+from server.util import resume_export_jobs
+from server.util import resume_stale_export_job
+from server.util import validators
+from server.util import log_event
+from server.util.exceptions import AppException
+
+from server.constants import EVENTS
+from server.constants import EXCODES
+from server.constants import STRINGS
+
+api = Blueprint('exports', __name__)
+
+
+@api.route('/songbooks/<songbook_id>/exports', methods=['POST'])
+@login_required
+def songbook_exports(songbook_id):
+    songbook = validators.songbook_existence(songbook_id)
+    if current_user.get_id() != songbook.get_owner():
+        raise AppException(EVENTS.BASE_EXCEPTION, 403,
+                           (EXCODES.INSUFFICIENT_PERMISSIONS, STRINGS.INSUFFICIENT_PERMISSIONS))
+
+    data = {'songbook_id': songbook_id, 'owner': current_user.get_id()}
+
+    job = g.model.jobs.create_job(data)
+    log_event(EVENTS.EXPORT_NEW, current_user.get_id(), data)
+
+    # export itself runs in the export worker pool
+    enqueue_export_job(job)
+
+    return jsonify(job.get_serialized_data()), 202, \
+          {'location': '/exports/{}'.format(job.get_id())}
+
+
+@api.route('/exports/stats', methods=['GET'])
+@login_required
+def export_stats():
+    # statistics contain exports of all users
+    if not current_user.is_editor():
+        raise AppException(EVENTS.BASE_EXCEPTION, 403,
+                           (EXCODES.INSUFFICIENT_PERMISSIONS, STRINGS.INSUFFICIENT_PERMISSIONS))
+
+    return jsonify(g.model.export_stats.get_summary()), 200
+
+
+@api.route('/exports/<job_id>', methods=['GET'])
+@login_required
+def export_single(job_id):
+    job = validators.job_existence(job_id)
+    if current_user.get_id() != job.get_owner():
+        raise AppException(EVENTS.BASE_EXCEPTION, 403,
+                           (EXCODES.INSUFFICIENT_PERMISSIONS, STRINGS.INSUFFICIENT_PERMISSIONS))
+
+    # make sure that jobs left over from previous run (or crashed worker) are being processed
+    if not job.is_finished() and not resume_export_jobs():
+        resume_stale_export_job(job)
+
+    return jsonify(job.get_serialized_data()), 200
+
+
+app.register_blueprint(api, url_prefix='/api/v1')
@@ -18,10 +18,23 @@ api = Blueprint('interpreters', __name__)
 @login_required
 def interpreters():
     if request.method == 'GET':
-        result = g.model.interpreters.find()
-        response = []
+        # return all interpreters unless paged result is requested
+        if not any(arg in request.args for arg in ('query', 'page', 'per_page', 'after', 'fuzzy')):
+            result = g.model.interpreters.find()
+            response = []
+            for res in result:
+                response.append(res.get_serialized_data())
+
+            return jsonify(response), 200
+
+        data = validators.handle_GET_request(request.args)
+        result, next_cursor = g.model.interpreters.find_special(data['query'], data['page'],
+                                                                data['per_page'], data['after'],
+                                                                data['fuzzy'])
+
+        response = {'data': [], 'next_cursor': next_cursor}
         for res in result:
-            response.append(res.get_serialized_data())
+            response['data'].append(res.get_serialized_data())
 
         return jsonify(response), 200
 
@@ -21,6 +21,7 @@ from server.app import app
 from server.app import skautis
 
 from server.util import log_event
+from server.util import cleanup_formats
 from server.util import AppException
 
 from server.constants import STRINGS
@@ -148,13 +149,16 @@ def cleanup():
                 g.model.songbooks.save(songbook)
             else:
                 # append cached file as valid
-                valid_files.append(get_cached_file() + '.pdf')
+                valid_files.append(songbook.get_cached_file() + '.pdf')
 
     # check every file in done folder and delete invalid ones
     for temp_file in os.listdir(app.config['SONGBOOK_DONE_FOLDER']):
         if temp_file not in valid_files:
             os.unlink(app.config['SONGBOOK_DONE_FOLDER'] + temp_file)
 
+    # remove precompiled formats of outdated songbook preambles
+    cleanup_formats()
+
     return 'Ok'
 
 
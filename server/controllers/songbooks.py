@@ -28,21 +28,17 @@ def songbooks():
         data = validators.handle_GET_request(request.args)
 
         # find all results for currect user
-        result = g.model.songbooks.find_filtered(data['query'], current_user.get_id())
+        result, size, next_cursor = g.model.songbooks.find_filtered(
+            data['query'], current_user.get_id(), data['page'], data['per_page'], data['after'])
 
-        # prepare response
-        size = len(result)
-        response = {
-            'data': [],
-            'count': size,
-            'pages': int(math.ceil(size / data['per_page']))
-        } # yapf: disable
-
-        # slice results based on 'page' and 'per_page' values
-        result = result[(data['per_page'] * data['page']):(data['per_page'] * (data['page'] + 1))]
+        # prepare response (count is not known when paging by cursor)
+        response = {'data': [], 'next_cursor': next_cursor}
+        if size is not None:
+            response['count'] = size
+            response['pages'] = int(math.ceil(size / data['per_page']))
 
         for res in result:
-            response['data'].append(res.get_serialized_data())
+            response['data'].append(res.get_serialized_summary())
 
         return jsonify(response), 200
 
@@ -11,6 +11,7 @@ from server.app import app
 from server.util import permissions
 from server.util import validators
 from server.util import log_event
+from server.util import ndjson_response
 from server.util.exceptions import AppException
 
 from server.constants import EVENTS
@@ -27,22 +28,26 @@ def songs():
     if request.method == 'GET':
         data = validators.handle_GET_request(request.args)
 
-        # find all results for currect user
-        result = g.model.songs.find_filtered(data['query'], data['order'], current_user.get_id())
+        # stream songs one per line without counting all results
+        if 'Accept' in request.headers and request.headers['Accept'] == 'application/x-ndjson':
+            result = g.model.songs.find_filtered_iter(data['query'], data['order'],
+                                                      current_user.get_id(), data['page'],
+                                                      data['per_page'], data['after'],
+                                                      data['fuzzy'])
+            return ndjson_response(g.model.songs.serialize_iter(result, current_user.get_id())), 200
 
-        # prepare response
-        size = len(result)
-        response = {
-            'data': [],
-            'count': size,
-            'pages': int(math.ceil(size / data['per_page']))
-        } # yapf: disable
+        # find all results for currect user
+        result, size, next_cursor = g.model.songs.find_filtered(
+            data['query'], data['order'], current_user.get_id(), data['page'], data['per_page'],
+            data['after'], data['fuzzy'])
 
-        # slice results based on 'page' and 'per_page' values
-        result = result[(data['per_page'] * data['page']):(data['per_page'] * (data['page'] + 1))]
+        # prepare response (count is not known when paging by cursor)
+        response = {'data': [], 'next_cursor': next_cursor}
+        if size is not None:
+            response['count'] = size
+            response['pages'] = int(math.ceil(size / data['per_page']))
 
-        for res in result:
-            response['data'].append(res.get_serialized_data(current_user.get_id()))
+        response['data'] = g.model.songs.serialize_many(result, current_user.get_id())
 
         return jsonify(response), 200
 
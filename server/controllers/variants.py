@@ -11,6 +11,9 @@ from server.app import app
 from server.util import permissions
 from server.util import validators
 from server.util import log_event
+from server.util import translate_many
+from server.util import ndjson_response
+from server.util.workers import get_pool
 from server.util.exceptions import AppException
 
 from server.constants import EVENTS
@@ -21,42 +24,70 @@ from server.constants import PERMISSION
 api = Blueprint('variants', __name__)
 
 
+def _explode_variants(songs):
+    # remove nesting - explode variants and add song data to each of them
+    for song in songs:
+        for variant in song['variants']:
+            variant['song'] = {
+                'id': song['id'],
+                'created': song['created'],
+                'title': song['title'],
+                'authors': song['authors'],
+                'interpreters': song['interpreters']
+            }
+            yield variant
+
+
 @api.route('/variants', methods=['GET'])
 @login_required
 def variants():
     data = validators.handle_GET_request(request.args)
 
+    # stream variants one per line without counting all results
+    if 'Accept' in request.headers and request.headers['Accept'] == 'application/x-ndjson':
+        result = g.model.songs.find_filtered_iter(data['query'], data['order'],
+                                                  current_user.get_id(), data['page'],
+                                                  data['per_page'], data['after'],
+                                                  data['fuzzy'])
+        songs = g.model.songs.serialize_iter(result, current_user.get_id())
+        return ndjson_response(_explode_variants(songs)), 200
+
     # find all results for currect user
-    result = g.model.songs.find_filtered(data['query'], data['order'], current_user.get_id())
+    result, size, next_cursor = g.model.songs.find_filtered(
+        data['query'], data['order'], current_user.get_id(), data['page'], data['per_page'],
+        data['after'], data['fuzzy'])
+
+    # prepare response (count is not known when paging by cursor)
+    response = {'data': [], 'next_cursor': next_cursor}
+    if size is not None:
+        response['count'] = size
+        response['pages'] = int(math.ceil(size / data['per_page']))
 
-    # prepare response
-    size = len(result)
-    response = {
-        'data': [],
-        'count': size,
-        'pages': int(math.ceil(size / data['per_page']))
-    } # yapf: disable
+    songs = g.model.songs.serialize_many(result, current_user.get_id())
+    response['data'] = list(_explode_variants(songs))
 
-    # slice results based on 'page' and 'per_page' values
-    result = result[(data['per_page'] * data['page']):(data['per_page'] * (data['page'] + 1))]
+    return jsonify(response), 200
 
-    songs = []
 
-    for res in result:
-        songs.append(res.get_serialized_data(current_user.get_id()))
+@api.route('/variants/validate', methods=['POST'])
+@login_required
+def variants_validate():
+    data = request.get_json()
+    validators.json_request(data)
+    data = validators.variants_validate_request(data)
 
-    # remove nesting - explode variants into response and add song data
-    for song in songs:
-        for variant in song['variants']:
-            variant['song'] = {
-                'id': song['id'],
-                'created': song['created'],
-                'title': song['title'],
-                'authors': song['authors'],
-                'interpreters': song['interpreters']
-            }
-            response['data'].append(variant)
+    # translate large batches in translator worker processes
+    pool = None
+    if len(data['texts']) > app.config['TRANSLATOR_BATCH_SIZE']:
+        pool = get_pool('translator', app.config['TRANSLATOR_WORKERS'])
+
+    result = translate_many(data['texts'], pool=pool, batch_size=app.config['TRANSLATOR_BATCH_SIZE'])
+
+    # stream translation logs as soon as they are finished
+    if 'Accept' in request.headers and request.headers['Accept'] == 'application/x-ndjson':
+        return ndjson_response(result), 200
 
+    response = sorted(result, key=lambda item: item['index'])
     return jsonify(response), 200
 
 
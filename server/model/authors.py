@@ -1,4 +1,16 @@
+import pymongo
+
 from bson import ObjectId
+from bson.son import SON
+from flask import current_app
+
+from server.util import split_page
+from server.util import keyset_query
+from server.util import FuzzyIndex
+from server.util import load_in_order
+from server.util import page_in_memory
+from server.util import find_one_mapped
+from server.util import discard_mapped
 
 
 class Authors(object):
@@ -21,6 +33,12 @@ class Authors(object):
         self._db = db
         self._collection = db[self.COLLECTION_NAME]
 
+        self._fuzzy = FuzzyIndex(self._get_fuzzy_entries)
+
+    def _get_fuzzy_entries(self):
+        for doc in self._collection.find({}, {'name': 1}):
+            yield doc['_id'], doc['name']
+
     def create_author(self, data):
         """Create new author and insert it into database.
 
@@ -32,6 +50,7 @@ class Authors(object):
         """
         author = Author({'_id': ObjectId(), 'name': data['name']})
         self._collection.insert_one(author.serialize())
+        self._fuzzy.add(author._id, author.get_name())
         return author
 
     def save(self, author):
@@ -41,6 +60,9 @@ class Authors(object):
           author (Author): Instance of the author.
         """
         self._collection.update_one({'_id': author._id}, {'$set': author.serialize(update=True)})
+        discard_mapped(self._collection, author._id)
+        self._fuzzy.add(author._id, author.get_name())
+        self._update_song_search(author)
 
     def delete(self, author):
         """Delete author from the database.
@@ -49,6 +71,14 @@ class Authors(object):
           author (Author): Instance of the author.
         """
         self._collection.delete_one({'_id': author._id})
+        discard_mapped(self._collection, author._id)
+        self._fuzzy.remove(author._id)
+        self._update_song_search(author)
+
+    def _update_song_search(self, author):
+        # names are part of the full-text search data of songs
+        for song in self._model.songs.find_by_reference(author_id=author.get_id()):
+            self._model.variants.update_search(song)
 
     def find(self):
         """Find all authors in the database."""
@@ -60,33 +90,57 @@ class Authors(object):
 
         return authors
 
-    def find_special(self, query, page, per_page):
+    def find_special(self, query, page, per_page, after=None, fuzzy=False):
         """Find authors from the database based on query and page the result.
 
         Args:
           query (str): Query string.
-          page (int): Result page number.
+          page (int): Result page number (ignored if `after` is given).
           per_page (int): Number of authors per search result.
+          after (dict, optional): Decoded cursor of the previous page.
+          fuzzy (bool, optional): Find authors with names similar to the query.
 
         If the query string is empty, whole database is returned (and paged).
 
         Returns:
-          list: List of Author instances satisfying the query.
+          tuple: List of Author instances satisfying the query and cursor
+            of the next page.
         """
         if query is None or query == "":
-            doc = self._collection.find({}).skip(page * per_page) \
-                                  .limit(per_page)
+            sort = [('_id', pymongo.ASCENDING)]
+        else:
+            sort = [('score', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+
+        if fuzzy and query is not None and query != "":
+            # rank authors by name similarity, only the page is loaded from the database
+            scores = self._fuzzy.search(query, current_app.config['FUZZY_INDEX_TTL'])
+            entries = [{'_id': item_id, 'score': score} for item_id, score in scores.items()]
+
+            skip = page * per_page if after is None else 0
+            entries, _ = page_in_memory(entries, sort, skip, per_page + 1, after)
+            docs = load_in_order(self._collection, entries)
         else:
-            doc = self._collection.find({'$text':{'$search': query}},
-                                        {'score': {'$meta': "textScore"}}) \
-                                  .sort([('score', {'$meta': 'textScore'})]) \
-                                  .skip(page * per_page).limit(per_page)
+            pipeline = []
+            if query is not None and query != "":
+                pipeline.append({'$match': {'$text': {'$search': query}}})
+                pipeline.append({'$addFields': {'score': {'$meta': 'textScore'}}})
+
+            if after is not None:
+                pipeline.append({'$match': keyset_query(sort, after)})
+            pipeline.append({'$sort': SON(sort)})
+            if after is None:
+                pipeline.append({'$skip': page * per_page})
+            pipeline.append({'$limit': per_page + 1})
+
+            docs = list(self._collection.aggregate(pipeline))
+
+        docs, next_cursor = split_page(docs, sort, per_page)
 
         authors = []
-        for author in doc:
+        for author in docs:
             authors.append(Author(author))
 
-        return authors
+        return authors, next_cursor
 
     def find_one(self, author_id=None, name=None):
         """Find one author based on given arguments.
@@ -104,11 +158,7 @@ class Authors(object):
         if name is not None:
             query['name'] = name
 
-        doc = self._collection.find_one(query)
-        if not doc:
-            return None
-
-        return Author(doc)
+        return find_one_mapped(self._collection, query, Author)
 
 
 class Author(object):
@@ -1,4 +1,16 @@
+import pymongo
+
 from bson import ObjectId
+from bson.son import SON
+from flask import current_app
+
+from server.util import split_page
+from server.util import keyset_query
+from server.util import FuzzyIndex
+from server.util import load_in_order
+from server.util import page_in_memory
+from server.util import find_one_mapped
+from server.util import discard_mapped
 
 
 class Interpreters(object):
@@ -21,6 +33,12 @@ class Interpreters(object):
         self._db = db
         self._collection = db[self.COLLECTION_NAME]
 
+        self._fuzzy = FuzzyIndex(self._get_fuzzy_entries)
+
+    def _get_fuzzy_entries(self):
+        for doc in self._collection.find({}, {'name': 1}):
+            yield doc['_id'], doc['name']
+
     def create_interpreter(self, data):
         """Create new interpreter and insert it into database.
 
@@ -32,6 +50,7 @@ class Interpreters(object):
         """
         interpreter = Interpreter({'_id': ObjectId(), 'name': data['name']})
         self._collection.insert_one(interpreter.serialize())
+        self._fuzzy.add(interpreter._id, interpreter.get_name())
         return interpreter
 
     def save(self, interpreter):
@@ -46,6 +65,9 @@ class Interpreters(object):
             }, {
                 '$set': interpreter.serialize(update=True)
             })
+        discard_mapped(self._collection, interpreter._id)
+        self._fuzzy.add(interpreter._id, interpreter.get_name())
+        self._update_song_search(interpreter)
 
     def delete(self, interpreter):
         """Delete interpreter from the database.
@@ -54,6 +76,14 @@ class Interpreters(object):
           interpreter (Interpreter): Instance of the interpreter.
         """
         self._collection.delete_one({'_id': interpreter._id})
+        discard_mapped(self._collection, interpreter._id)
+        self._fuzzy.remove(interpreter._id)
+        self._update_song_search(interpreter)
+
+    def _update_song_search(self, interpreter):
+        # names are part of the full-text search data of songs
+        for song in self._model.songs.find_by_reference(interpreter_id=interpreter.get_id()):
+            self._model.variants.update_search(song)
 
     def find(self):
         """Find all interpreters in the database."""
@@ -65,33 +95,57 @@ class Interpreters(object):
 
         return interpreters
 
-    def find_special(self, query, page, per_page):
+    def find_special(self, query, page, per_page, after=None, fuzzy=False):
         """Find interpreters from the database based on query and page the result.
 
         Args:
           query (str): Query string.
-          page (int): Result page number.
+          page (int): Result page number (ignored if `after` is given).
           per_page (int): Number of interpreters per search result.
+          after (dict, optional): Decoded cursor of the previous page.
+          fuzzy (bool, optional): Find interpreters with names similar to the query.
 
         If the query string is empty, whole database is returned (and paged).
 
         Returns:
-          list: List of Interpreter instances satisfying the query.
+          tuple: List of Interpreter instances satisfying the query and cursor
+            of the next page.
         """
         if query is None or query == "":
-            doc = self._collection.find({}).skip(page * per_page) \
-                                  .limit(per_page)
+            sort = [('_id', pymongo.ASCENDING)]
+        else:
+            sort = [('score', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+
+        if fuzzy and query is not None and query != "":
+            # rank interpreters by name similarity, only the page is loaded from the database
+            scores = self._fuzzy.search(query, current_app.config['FUZZY_INDEX_TTL'])
+            entries = [{'_id': item_id, 'score': score} for item_id, score in scores.items()]
+
+            skip = page * per_page if after is None else 0
+            entries, _ = page_in_memory(entries, sort, skip, per_page + 1, after)
+            docs = load_in_order(self._collection, entries)
         else:
-            doc = self._collection.find({'$text':{'$search': query}},
-                                        {'score': {'$meta': "textScore"}}) \
-                                  .sort([('score', {'$meta': 'textScore'})]) \
-                                  .skip(page * per_page).limit(per_page)
+            pipeline = []
+            if query is not None and query != "":
+                pipeline.append({'$match': {'$text': {'$search': query}}})
+                pipeline.append({'$addFields': {'score': {'$meta': 'textScore'}}})
+
+            if after is not None:
+                pipeline.append({'$match': keyset_query(sort, after)})
+            pipeline.append({'$sort': SON(sort)})
+            if after is None:
+                pipeline.append({'$skip': page * per_page})
+            pipeline.append({'$limit': per_page + 1})
+
+            docs = list(self._collection.aggregate(pipeline))
+
+        docs, next_cursor = split_page(docs, sort, per_page)
 
         interpreters = []
-        for interpreter in doc:
+        for interpreter in docs:
             interpreters.append(Interpreter(interpreter))
 
-        return interpreters
+        return interpreters, next_cursor
 
     def find_one(self, interpreter_id=None, name=None):
         """Find one interpreter based on given arguments.
@@ -109,11 +163,7 @@ class Interpreters(object):
         if name is not None:
             query['name'] = name
 
-        doc = self._collection.find_one(query)
-        if not doc:
-            return None
-
-        return Interpreter(doc)
+        return find_one_mapped(self._collection, query, Interpreter)
 
 
 class Interpreter(object):
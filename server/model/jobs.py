@@ -0,0 +1,258 @@
+import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from server.constants import JOB_STATUS
+
+
+class Jobs(object):
+    """Collection for managing CRUD operation in database for export jobs.
+
+    Args:
+      model (server.model.Model): Reference to model.
+      db (pymongo.MongoClient): Reference to database.
+
+    Attributes:
+      _model (server.model.Model): Reference to model.
+      _db: Reference to database.
+      _collection: Reference to collection in database for this class.
+    """
+
+    COLLECTION_NAME = 'jobs'
+
+    def __init__(self, model, db):
+        self._model = model
+        self._db = db
+        self._collection = db[self.COLLECTION_NAME]
+
+    def create_job(self, data):
+        """Create new export job and insert it into database.
+
+        Args:
+          data (dict): Job data containing 'songbook_id' and 'owner' dictionary keys.
+
+        Returns:
+          Job: Instance of the new job.
+        """
+        job = Job({
+            '_id': ObjectId(),
+            'songbook_id': data['songbook_id'],
+            'owner': data['owner'],
+            'status': JOB_STATUS.QUEUED,
+            'progress': 0,
+            'link': None,
+            'log': None,
+            'stats': None,
+            'updated': datetime.datetime.utcnow()
+        })
+        self._collection.insert_one(job.serialize())
+
+        return job
+
+    def save(self, job):
+        """Save job into the database.
+
+        Args:
+          job (Job): Instance of the job.
+        """
+        self._collection.update_one({'_id': job._id}, {'$set': job.serialize(update=True)})
+
+    def claim(self, job_id, timeout):
+        """Atomically mark queued (or abandoned running) job as running.
+
+        Args:
+          job_id (str): Job ObjectId string.
+          timeout (int): Number of seconds after which running job without
+            any update is considered abandoned.
+
+        Returns:
+          Job: Claimed Job or None if it was claimed by someone else.
+        """
+        now = datetime.datetime.utcnow()
+        doc = self._collection.find_one_and_update({
+            '_id': ObjectId(job_id),
+            '$or': [{
+                'status': JOB_STATUS.QUEUED
+            }, {
+                'status': JOB_STATUS.RUNNING,
+                'updated': {
+                    '$lt': now - datetime.timedelta(seconds=timeout)
+                }
+            }]
+        }, {
+            '$set': {
+                'status': JOB_STATUS.RUNNING,
+                'progress': 0,
+                'updated': now
+            }
+        }, return_document=ReturnDocument.AFTER) # yapf: disable
+
+        if not doc:
+            return None
+
+        return Job(doc)
+
+    def mark_resubmitted(self, job_id, timeout):
+        """Atomically mark stale job as resubmitted.
+
+        Stale job is marked at most once per timeout, so that concurrent
+        checks of the job do not resubmit it again and again.
+
+        Args:
+          job_id (str): Job ObjectId string.
+          timeout (int): Number of seconds after which unfinished job without
+            any update is considered stale.
+
+        Returns:
+          bool: True if the job was marked (and should be resubmitted).
+        """
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=timeout)
+        doc = self._collection.find_one_and_update({
+            '_id': ObjectId(job_id),
+            'status': {'$in': [JOB_STATUS.QUEUED, JOB_STATUS.RUNNING]},
+            'updated': {'$lt': stale},
+            '$or': [{'resubmitted': {'$exists': False}}, {'resubmitted': {'$lt': stale}}]
+        }, {'$set': {'resubmitted': now}})
+
+        return doc is not None
+
+    def find_unfinished(self):
+        """Find all jobs, which are queued or running."""
+        doc = self._collection.find(
+            {'status': {'$in': [JOB_STATUS.QUEUED, JOB_STATUS.RUNNING]}})
+
+        jobs = []
+        for job in doc:
+            jobs.append(Job(job))
+
+        return jobs
+
+    def find_one(self, job_id=None):
+        """Find one job based on given arguments.
+
+        Args:
+          job_id (str, optional): Job ObjectId string.
+
+        Returns:
+          Job: One Job or None if it does not exist.
+        """
+        query = {}
+        if job_id is not None:
+            query['_id'] = ObjectId(job_id)
+
+        doc = self._collection.find_one(query)
+        if not doc:
+            return None
+
+        return Job(doc)
+
+
+class Job(object):
+    """Class for export job abstraction.
+
+    Args:
+      job (dict): Job dictionary.
+
+    Attributes:
+      _id (str): Job ObjectId.
+      _songbook_id (str): Id of exported songbook.
+      _owner (str): User Id
+      _status (str): Job status (see `JOB_STATUS`).
+      _progress (int): Export progress in percents.
+      _link (str): Link to the exported file (when finished).
+      _log (list): Errors, which occured during the export.
+      _stats (dict): Export statistics (when finished, see `export_songbook`).
+      _updated (datetime): Timestamp of the last job update.
+    """
+
+    def __init__(self, job):
+        self._id = job['_id']
+        self._songbook_id = job['songbook_id']
+        self._owner = job['owner']
+        self._status = job['status']
+        self._progress = job['progress']
+        self._link = job['link']
+        self._log = job['log']
+        self._stats = job.get('stats')
+        self._updated = job['updated']
+
+    def serialize(self, update=False):
+        """Serialize job data for database operations.
+
+        Args:
+          update (bool, optional): Determines whether method returns only
+            update attributes or data for new database entry.
+        """
+        job = {
+            'status': self._status,
+            'progress': self._progress,
+            'link': self._link,
+            'log': self._log,
+            'stats': self._stats,
+            'updated': self._updated
+        }
+
+        if not update:
+            job['_id'] = self._id
+            job['songbook_id'] = self._songbook_id
+            job['owner'] = self._owner
+
+        return job
+
+    def get_serialized_data(self):
+        return {
+            'id': str(self._id),
+            'created': self._id.generation_time,
+            'songbook_id': self._songbook_id,
+            'owner': self._owner,
+            'status': self._status,
+            'progress': self._progress,
+            'link': self._link,
+            'log': self._log,
+            'stats': self._stats
+        }
+
+    def get_id(self):
+        return str(self._id)
+
+    def get_songbook_id(self):
+        return self._songbook_id
+
+    def get_owner(self):
+        return self._owner
+
+    def get_status(self):
+        return self._status
+
+    def is_finished(self):
+        return self._status in [JOB_STATUS.DONE, JOB_STATUS.FAILED]
+
+    def is_stale(self, timeout):
+        """Check whether unfinished job was not updated for given number of seconds."""
+        return not self.is_finished() and \
+            self._updated < datetime.datetime.utcnow() - datetime.timedelta(seconds=timeout)
+
+    def touch(self):
+        self._updated = datetime.datetime.utcnow()
+
+    def set_progress(self, progress):
+        self._progress = progress
+        self._updated = datetime.datetime.utcnow()
+
+    def finish(self, link, stats=None):
+        self._status = JOB_STATUS.DONE
+        self._progress = 100
+        self._link = link
+        self._stats = stats
+        self._updated = datetime.datetime.utcnow()
+
+    def fail(self, log):
+        self._status = JOB_STATUS.FAILED
+        self._log = log
+        self._updated = datetime.datetime.utcnow()
+
+    def __repr__(self):
+        return '<{!r} id={!r} songbook_id={!r} status={!r}>' \
+            .format(self.__class__.__name__, self._id, self._songbook_id, self._status)
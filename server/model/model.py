@@ -4,6 +4,7 @@ class Model(object):
 
     Args:
       db: Reference to database.
+      search (bool, optional): Whether to build in-memory search index.
 
     Attributes:
       logs (server.model.Logs): Submodel for managing logs.
@@ -13,15 +14,20 @@ class Model(object):
       variants (server.model.Variants): Submodel for managing variants.
       songbooks (server.model.Songbooks): Submodel for managing songbooks.
       interpreters (server.model.Interpreters): Submodel for managing interpreters.
+      jobs (server.model.Jobs): Submodel for managing export jobs.
+      export_stats (server.model.ExportStats): Submodel for managing export statistics.
+      search (server.util.search.SearchIndex): In-memory search index (None if disabled).
     """
 
-    def __init__(self, db):
+    def __init__(self, db, search=False):
         from server.model.users import Users
         from server.model.songs import Songs
         from server.model.authors import Authors
         from server.model.variants import Variants
         from server.model.songbooks import Songbooks
         from server.model.interpreters import Interpreters
+        from server.model.jobs import Jobs
+        from server.model.stats import ExportStats
 
         self.users = Users(model=self, db=db)
         self.songs = Songs(model=self, db=db)
@@ -29,3 +35,12 @@ class Model(object):
         self.variants = Variants(model=self, db=db)
         self.songbooks = Songbooks(model=self, db=db)
         self.interpreters = Interpreters(model=self, db=db)
+        self.jobs = Jobs(model=self, db=db)
+        self.export_stats = ExportStats(model=self, db=db)
+
+        self.search = None
+        if search:
+            from server.util.search import SearchIndex
+
+            self.search = SearchIndex()
+            self.variants.build_search_index()
@@ -1,10 +1,16 @@
+import pymongo
 import datetime
 
 from bson import ObjectId
+from bson.son import SON
 from flask import g
 
 from server.util import validators
+from server.util import split_page
+from server.util import keyset_query
 from server.util import SongbookTemplate
+from server.util import find_one_mapped
+from server.util import discard_mapped
 
 from server.constants import OPTIONS
 from server.constants import DEFAULTS
@@ -46,9 +52,11 @@ class Songbooks(object):
             'owner': data['owner'],
             'options': data['options'] if 'options' in data else DEFAULTS.SONGBOOK_OPTIONS,
             'songs': data['songs'] if 'songs' in data else [],
+            'summary': None,
             'cached_file': None,
             'cache_expiration': None,
         }) # yapf: disable
+        self._update_summary(songbook)
         self._collection.insert_one(songbook.serialize())
 
         return songbook
@@ -59,12 +67,87 @@ class Songbooks(object):
         Args:
           songbook (Songbook): Instance of the songbook.
         """
+        self._update_summary(songbook)
         self._collection.update_one(
             {
                 '_id': songbook._id
             }, {
                 '$set': songbook.serialize(update=True)
             })
+        discard_mapped(self._collection, songbook._id)
+
+    def _update_summary(self, songbook):
+        # summary is recomputed only after the change of songbook songs
+        if songbook.get_summary() is None:
+            songbook.set_summary(
+                self._model.variants.find_extended_songbook_items(songbook.get_songs()))
+
+    def update_summary_song(self, song):
+        """Update song data in summaries of all songbooks containing the song.
+
+        Args:
+          song (Song): Instance of the song.
+        """
+        song_id = song.get_id()
+        title, interpreters = song.get_title(), song.get_interpreters()
+
+        query = {'summary': {'$elemMatch': {
+            'song.song_id': song_id,
+            '$or': [{'song.title': {'$ne': title}}, {'song.interpreters': {'$ne': interpreters}}]
+        }}} # yapf: disable
+        update = {
+            '$set': {
+                'summary.$[item].song.title': title,
+                'summary.$[item].song.interpreters': interpreters
+            }
+        }
+        self._update_summaries(query, update, lambda item: item['song']['song_id'] == song_id,
+                               array_filters=[{'item.song.song_id': song_id}])
+
+    def update_summary_variant(self, variant):
+        """Update variant data in summaries of all songbooks containing the variant.
+
+        Args:
+          variant (Variant): Instance of the variant.
+        """
+        variant_id = variant.get_id()
+        title, visibility = variant.get_title(), variant.get_visibility()
+
+        query = {'summary': {'$elemMatch': {
+            'variant_id': variant_id,
+            '$or': [{'title': {'$ne': title}}, {'visibility': {'$ne': visibility}}]
+        }}} # yapf: disable
+        update = {
+            '$set': {
+                'summary.$[item].title': title,
+                'summary.$[item].visibility': visibility
+            }
+        }
+        self._update_summaries(query, update, lambda item: item['variant_id'] == variant_id,
+                               array_filters=[{'item.variant_id': variant_id}])
+
+    def remove_summary_variant(self, variant):
+        """Remove deleted variant from summaries of all songbooks containing it.
+
+        Args:
+          variant (Variant): Instance of the variant.
+        """
+        variant_id = variant.get_id()
+        self._update_summaries({'summary.variant_id': variant_id},
+                               {'$pull': {'summary': {'variant_id': variant_id}}},
+                               lambda item: item['variant_id'] == variant_id)
+
+    def _update_summaries(self, query, update, contains, array_filters=None):
+        # query matches only summaries, which have to change, so that they are updated
+        # by one conditional update (without any window for concurrent changes)
+        result = self._collection.update_many(query, update, array_filters=array_filters)
+        if not result.modified_count:
+            return
+
+        # updated songbooks are not known, loaded songbooks containing the item are discarded
+        discard_mapped(
+            self._collection,
+            predicate=lambda songbook: any(contains(item) for item in songbook.get_summary() or []))
 
     def delete(self, songbook):
         """Delete songbook from the database.
@@ -73,6 +156,7 @@ class Songbooks(object):
           songbook (Songbook): Instance of the songbook.
         """
         self._collection.delete_one({'_id': songbook._id})
+        discard_mapped(self._collection, songbook._id)
 
     def find(self):
         """Find all songbooks in the database."""
@@ -84,30 +168,61 @@ class Songbooks(object):
 
         return songbooks
 
-    def find_filtered(self, query, user_id):
+    def find_filtered(self, query, user_id, page=0, per_page=30, after=None):
         """Find songbooks from the database based on query and permissions.
 
         Args:
           query (str): Query string.
           user_id (str): user Id string.
+          page (int, optional): Result page number (ignored if `after` is given).
+          per_page (int, optional): Number of songbooks per result page.
+          after (dict, optional): Decoded cursor of the previous page.
 
         All returned songbooks are accessible by this user. If the query string
-        is empty, every accessible songbook is returned.
+        is empty, every accessible songbook is returned. If the cursor is given,
+        songbooks following it are returned and total count of songbooks
+        is not computed (None is returned instead).
 
         Returns:
-          list: List of Songbook instances satisfying the query.
+          tuple: List of Songbook instances on given page, total number of
+            songbooks satisfying the query and cursor of the next page.
         """
         if query is None or query == "":
-            doc = self._collection.find({'owner': user_id})
+            pipeline = [{'$match': {'owner': user_id}}]
+            sort = [('_id', pymongo.ASCENDING)]
         else:
-            doc = self._collection.find({'owner': user_id, '$text': {'$search': query}},
-                                        {'score': {'$meta': 'textScore'}}) \
-                                  .sort([('score', {'$meta': 'textScore'})])
+            pipeline = [{'$match': {'owner': user_id, '$text': {'$search': query}}},
+                        {'$addFields': {'score': {'$meta': 'textScore'}}}]
+            sort = [('score', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+
+        if after is not None:
+            pipeline.append({'$match': keyset_query(sort, after)})
+        pipeline.append({'$sort': SON(sort)})
+
+        if after is None:
+            pipeline.append({
+                '$facet': {
+                    'data': [{'$skip': page * per_page}, {'$limit': per_page + 1}],
+                    'count': [{'$count': 'count'}]
+                }
+            }) # yapf: disable
+
+            result = next(self._collection.aggregate(pipeline))
+            docs = result['data']
+            count = result['count'][0]['count'] if result['count'] else 0
+        else:
+            pipeline.append({'$limit': per_page + 1})
+
+            docs = list(self._collection.aggregate(pipeline))
+            count = None
+
+        docs, next_cursor = split_page(docs, sort, per_page)
 
         songbooks = []
-        for songbook in doc:
+        for songbook in docs:
             songbooks.append(Songbook(songbook))
-        return songbooks
+
+        return songbooks, count, next_cursor
 
     def find_one(self, songbook_id=None, title=None):
         """Find one songbook based on given arguments.
@@ -125,11 +240,7 @@ class Songbooks(object):
         if title is not None:
             query['title'] = title
 
-        doc = self._collection.find_one(query)
-        if not doc:
-            return None
-
-        return Songbook(doc)
+        return find_one_mapped(self._collection, query, Songbook)
 
 
 class Songbook(object):
@@ -144,6 +255,7 @@ class Songbook(object):
       _songs (dict): Songs contained in this songbook.
       _owner (str): User Id
       _cached_file (str): Filename of cached songbook
+      _summary (list): Stored extended songs (see `Variants.find_extended_songbook_items`).
       _cache_expiration (str): Timestamp of the cache expiration creation.
     """
 
@@ -154,6 +266,9 @@ class Songbook(object):
         self._owner = songbook['owner']
         self._options = songbook['options']
 
+        # denormalized extended songs (None if they have to be recomputed)
+        self._summary = songbook.get('summary')
+
         self._cached_file = songbook['cached_file']
         self._cache_expiration = songbook['cache_expiration']
 
@@ -169,6 +284,7 @@ class Songbook(object):
             'songs': self._songs,
             'owner': self._owner,
             'options': self._options,
+            'summary': self._summary,
             'cached_file': self._cached_file,
             'cache_expiration': self._cache_expiration
         }
@@ -181,7 +297,15 @@ class Songbook(object):
     def get_serialized_data(self):
         # map extended songs representations on songs list
         extended_data = g.model.variants.find_extended_songbook_items(self._songs)
+        return self._serialize_data(extended_data)
 
+    def get_serialized_summary(self):
+        """Get serialized songbook with stored extended songs (without any query)."""
+        if self._summary is None:
+            return self.get_serialized_data()
+        return self._serialize_data(self._summary)
+
+    def _serialize_data(self, extended_data):
         return {
             'id': str(self._id),
             'created': self._id.generation_time,
@@ -203,6 +327,12 @@ class Songbook(object):
     def get_songs(self):
         return self._songs
 
+    def get_summary(self):
+        return self._summary
+
+    def set_summary(self, summary):
+        self._summary = summary
+
     def get_owner(self):
         return self._owner
 
@@ -242,6 +372,7 @@ class Songbook(object):
     def set_songs(self, songs):
         self.invalidate_cache()
         self._songs = songs
+        self._summary = None
 
     def set_options(self, options):
         self.invalidate_cache()
@@ -253,6 +384,7 @@ class Songbook(object):
         self._title = data['title']
         self._options = data['options']
         self._songs = data['songs']
+        self._summary = None
 
     def get_output_template(self):
         return SongbookTemplate(self._options)
@@ -1,10 +1,19 @@
 import pymongo
 
 from bson import ObjectId
+from bson.son import SON
 from flask import g
+from flask import current_app
 
 from server.util import validators
+from server.util import split_page
+from server.util import keyset_query
+from server.util import FuzzyIndex
+from server.util import load_in_order
+from server.util import page_in_memory
 from server.util import translate_to_tex
+from server.util import find_one_mapped
+from server.util import discard_mapped
 
 from server.constants import EVENTS
 from server.constants import EXCODES
@@ -33,6 +42,12 @@ class Songs(object):
         self._db = db
         self._collection = db[self.COLLECTION_NAME]
 
+        self._fuzzy = FuzzyIndex(self._get_fuzzy_entries)
+
+    def _get_fuzzy_entries(self):
+        for doc in self._collection.find({}, {'title': 1}):
+            yield doc['_id'], doc['title']
+
     def create_song(self, data):
         """Create new song and insert it into database.
 
@@ -54,6 +69,7 @@ class Songs(object):
             'approved': False
         })
         self._collection.insert_one(song.serialize())
+        self._fuzzy.add(song._id, song.get_title())
 
         return song
 
@@ -64,6 +80,14 @@ class Songs(object):
           song (Song): Instance of the song.
         """
         self._collection.update_one({'_id': song._id}, {'$set': song.serialize(update=True)})
+        discard_mapped(self._collection, song._id)
+        self._fuzzy.add(song._id, song.get_title())
+
+        if song.is_search_changed():
+            self._model.variants.update_search(song)
+        if song.is_summary_changed():
+            self._model.songbooks.update_summary_song(song)
+        song.mark_saved()
 
     def delete(self, song):
         """Delete song from the database.
@@ -72,6 +96,8 @@ class Songs(object):
           song (Song): Instance of the song.
         """
         self._collection.delete_one({'_id': song._id})
+        discard_mapped(self._collection, song._id)
+        self._fuzzy.remove(song._id)
 
     def find(self):
         """Find all songs in the database."""
@@ -83,46 +109,310 @@ class Songs(object):
 
         return songs
 
-    def find_filtered(self, query, order, user_id):
+    def find_filtered(self, query, order, user_id, page=0, per_page=30, after=None, fuzzy=False):
         """Find songs from the database based on query and permissions.
 
         Args:
           query (str): Query string.
+          order (str): Ordering of the result (see `ORDERING`).
           user_id (str): user Id string.
+          page (int, optional): Result page number (ignored if `after` is given).
+          per_page (int, optional): Number of songs per result page.
+          after (dict, optional): Decoded cursor of the previous page.
+          fuzzy (bool, optional): Find songs with titles similar to the query.
 
         All returned songs are accessible by this user. If the query string
         is empty, every accessible song is returned.
         Only songs with at least one variant reachable by user are returned.
+        The query is searched in song titles, names of authors and interpreters
+        and lyrics of reachable variants (songs are ranked by the best variant).
+        Fuzzy search matches song titles only (and tolerates typos).
+
+        Filtering, sorting and paging is done in one aggregation pipeline,
+        so only songs of the requested page are sent from the database.
+        If the cursor is given, songs following it are returned and total
+        count of songs is not computed (None is returned instead).
 
         Returns:
-          list: List of Song instances satisfying the query.
+          tuple: List of Song instances on given page, total number of songs
+            satisfying the query and cursor of the next page.
         """
-        reachable_songs = g.model.variants.find_reachable_song_ids(user_id)
+        sort = self._get_sort(query, order)
+
+        find = self._get_in_memory_finder(query, fuzzy)
+        if find is not None:
+            skip = page * per_page if after is None else 0
+            docs, count = find(query, sort, user_id, skip, per_page + 1, after)
+            docs, next_cursor = split_page(docs, sort, per_page)
+
+            songs = []
+            for song in docs:
+                songs.append(Song(song))
+
+            return songs, count, next_cursor
+
+        collection, pipeline = self._filtered_pipeline(query, sort, user_id, after)
+
+        if after is None:
+            # return requested page together with total count of found songs
+            pipeline.append({
+                '$facet': {
+                    'data': [{'$skip': page * per_page}, {'$limit': per_page + 1}],
+                    'count': [{'$count': 'count'}]
+                }
+            }) # yapf: disable
+
+            result = next(collection.aggregate(pipeline))
+            docs = result['data']
+            count = result['count'][0]['count'] if result['count'] else 0
+        else:
+            pipeline.append({'$limit': per_page + 1})
 
-        query_array = []
-        for res in reachable_songs:
-            query_array.append(ObjectId(res))
+            docs = list(collection.aggregate(pipeline))
+            count = None
+
+        docs, next_cursor = split_page(docs, sort, per_page)
+
+        songs = []
+        for song in docs:
+            songs.append(Song(song))
+
+        return songs, count, next_cursor
+
+    def find_filtered_iter(self,
+                           query,
+                           order,
+                           user_id,
+                           page=0,
+                           per_page=30,
+                           after=None,
+                           fuzzy=False):
+        """Iterate over songs from the database based on query and permissions.
 
+        Same as `find_filtered`, but songs are read lazily from the database
+        cursor and total count of songs is not computed.
+
+        Yields:
+          Song: Song instances on given page.
+        """
+        sort = self._get_sort(query, order)
+
+        find = self._get_in_memory_finder(query, fuzzy)
+        if find is not None:
+            skip = page * per_page if after is None else 0
+            docs, _ = find(query, sort, user_id, skip, per_page, after)
+        else:
+            collection, pipeline = self._filtered_pipeline(query, sort, user_id, after)
+            if after is None:
+                pipeline.append({'$skip': page * per_page})
+            pipeline.append({'$limit': per_page})
+
+            docs = collection.aggregate(pipeline)
+
+        for song in docs:
+            yield Song(song)
+
+    def _get_in_memory_finder(self, query, fuzzy):
+        # queries can be answered by in-memory indexes, which return songs ranked by score
         if query is None or query == "":
-            doc = self._collection.find({'_id': {"$in": query_array}})
+            return None
+        if fuzzy:
+            return self._find_fuzzy
+        if self._model.search is not None:
+            return self._find_indexed
+        return None
+
+    def _get_sort(self, query, order):
+        # sort result based on order by value (or text score in case of query)
+        if order == ORDERING.TITLE:
+            return [('title', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]
+        elif order == ORDERING.TITLE_DESC:
+            return [('title', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
+        elif query is not None and query != "":
+            return [('score', pymongo.DESCENDING), ('_id', pymongo.ASCENDING)]
         else:
-            doc = self._collection.find({'_id': {"$in": query_array},
-                                         '$text': {'$search': query}},
-                                        {'score': {'$meta': 'textScore'}}) \
-                                  .sort([('score', {'$meta': 'textScore'})]) # yapf: disable
-
-        # sort result based on order by value
-        if order is not None:
-            if order == ORDERING.TITLE:
-                doc.sort("title", pymongo.ASCENDING)
-            elif order == ORDERING.TITLE_DESC:
-                doc.sort("title", pymongo.DESCENDING)
+            return [('_id', pymongo.ASCENDING)]
+
+    def _find_indexed(self, query, sort, user_id, skip, limit, after=None):
+        # rank songs in the in-memory index, only the requested page is loaded from the database
+        entries = []
+        for song_id, score in self._model.search.search(query, user_id).items():
+            entries.append({
+                '_id': song_id,
+                'score': score,
+                'title': self._model.search.get_title(song_id)
+            })
+
+        entries, count = page_in_memory(entries, sort, skip, limit, after)
+        return load_in_order(self._collection, entries), count
+
+    def _find_fuzzy(self, query, sort, user_id, skip, limit, after=None):
+        # find songs with similar titles and filter out the unreachable ones
+        scores = self._fuzzy.search(query, current_app.config['FUZZY_INDEX_TTL'])
+        reachable = self._model.variants.find_reachable_song_ids(user_id, song_ids=list(scores))
+
+        entries = []
+        for song_id in reachable:
+            entries.append({
+                '_id': song_id,
+                'score': scores[song_id],
+                'title': self._fuzzy.get_text(song_id)
+            })
+
+        entries, count = page_in_memory(entries, sort, skip, limit, after)
+        return load_in_order(self._collection, entries), count
+
+    def _filtered_pipeline(self, query, sort, user_id, after=None):
+        if query is not None and query != "":
+            collection = self._db[self._model.variants.COLLECTION_NAME]
+            pipeline = self._search_pipeline(query, user_id)
+        else:
+            collection = self._collection
+            pipeline = []
+
+        # songs are sorted before the permission lookup so that the sort index can be used
+        if after is not None:
+            pipeline.append({'$match': keyset_query(sort, after)})
+        pipeline.append({'$sort': SON(sort)})
+
+        # filter songs without any variant reachable by the user (already done by search)
+        if query is None or query == "":
+            pipeline.append({
+                '$lookup': {
+                    'from': self._model.variants.COLLECTION_NAME,
+                    'localField': '_id',
+                    'foreignField': 'song_id',
+                    'as': 'variants'
+                }
+            })
+            pipeline.append({
+                '$match': {
+                    'variants': {
+                        '$elemMatch': {
+                            '$or': [{
+                                'owner': user_id
+                            }, {
+                                'visibility': {
+                                    '$gte': PERMISSION.PUBLIC
+                                }
+                            }]
+                        }
+                    }
+                }
+            })
+            pipeline.append({'$project': {'variants': 0}})
+
+        return collection, pipeline
+
+    def _search_pipeline(self, query, user_id):
+        # variants contain lyrics and song data, so the text search runs over them
+        pipeline = [{
+            '$match': {
+                '$text': {
+                    '$search': query
+                },
+                '$or': [{
+                    'owner': user_id
+                }, {
+                    'visibility': {
+                        '$gte': PERMISSION.PUBLIC
+                    }
+                }]
+            }
+        }]
+        pipeline.append({'$addFields': {'score': {'$meta': 'textScore'}}})
+
+        # rank each song by its best matching variant and replace variants by their songs
+        pipeline.append({'$group': {'_id': '$song_id', 'score': {'$max': '$score'}}})
+        pipeline.append({
+            '$lookup': {
+                'from': self.COLLECTION_NAME,
+                'localField': '_id',
+                'foreignField': '_id',
+                'as': 'song'
+            }
+        })
+        pipeline.append({'$unwind': '$song'})
+        pipeline.append({
+            '$replaceRoot': {
+                'newRoot': {
+                    '$mergeObjects': ['$song', {
+                        'score': '$score'
+                    }]
+                }
+            }
+        })
+
+        return pipeline
+
+    def find_by_reference(self, author_id=None, interpreter_id=None):
+        """Find all songs, which reference given author or interpreter.
+
+        Args:
+          author_id (str, optional): Author ObjectId string.
+          interpreter_id (str, optional): Interpreter ObjectId string.
+
+        Returns:
+          list: List of Song instances.
+        """
+        query = {'$or': []}
+        if author_id is not None:
+            query['$or'].append({'authors.lyrics': author_id})
+            query['$or'].append({'authors.music': author_id})
+        if interpreter_id is not None:
+            query['$or'].append({'interpreters': interpreter_id})
+
+        if not query['$or']:
+            return []
 
         songs = []
-        for song in doc:
+        for song in self._collection.find(query):
             songs.append(Song(song))
+
         return songs
 
+    def serialize_many(self, songs, user_id):
+        """Serialize multiple songs together with their variants.
+
+        Args:
+          songs (list): List of Song instances.
+          user_id (str): user Id string.
+
+        Variants of all songs are loaded with one query instead of one
+        query per song.
+
+        Returns:
+          list: List of serialized songs (in the same order).
+        """
+        variants = self._model.variants.find_filtered_multiple(
+            user_id, [song.get_id() for song in songs])
+
+        serialized = []
+        for song in songs:
+            serialized.append(song.get_serialized_data(user_id, variants=variants[song.get_id()]))
+        return serialized
+
+    def serialize_iter(self, songs, user_id, batch_size=50):
+        """Serialize songs from given iterable lazily in batches.
+
+        Args:
+          songs (iterable): Song instances.
+          user_id (str): user Id string.
+          batch_size (int, optional): Number of songs serialized at once.
+
+        Yields:
+          dict: Serialized songs (in the same order).
+        """
+        batch = []
+        for song in songs:
+            batch.append(song)
+            if len(batch) == batch_size:
+                yield from self.serialize_many(batch, user_id)
+                batch = []
+
+        if batch:
+            yield from self.serialize_many(batch, user_id)
+
     def find_one(self, song_id=None, title=None):
         """Find one song based on given arguments.
 
@@ -139,11 +429,7 @@ class Songs(object):
         if title is not None:
             query['title'] = title
 
-        doc = self._collection.find_one(query)
-        if not doc:
-            return None
-
-        return Song(doc)
+        return find_one_mapped(self._collection, query, Song)
 
     def find_multiple(self, song_ids=[]):
         """Find multiple songs based on given arguments.
@@ -187,6 +473,9 @@ class Song(object):
         self._interpreters = song['interpreters']
         self._approved = song['approved']
 
+        # title, authors and interpreters stored in the database
+        self.mark_saved()
+
     def serialize(self, update=False):
         """Serialize song data for database operations.
 
@@ -207,11 +496,14 @@ class Song(object):
 
         return song
 
-    def get_serialized_data(self, user_id):
-        variants = []
-        variant_res = g.model.variants.find_filtered(user_id, song_id=str(self._id))
-        for variant in variant_res:
-            variants.append(variant.get_serialized_data())
+    def get_serialized_data(self, user_id, variants=None):
+        # load reachable variants unless they were already loaded by caller
+        if variants is None:
+            variants = g.model.variants.find_filtered(user_id, song_id=str(self._id))
+
+        serialized_variants = []
+        for variant in variants:
+            serialized_variants.append(variant.get_serialized_data())
 
         return {
             'id': str(self._id),
@@ -220,7 +512,7 @@ class Song(object):
             'authors': self._authors,
             'interpreters': self._interpreters,
             'approved': self._approved,
-            'variants': variants
+            'variants': serialized_variants
         }
 
     def get_simplified_variant_data(self, variant_id):
@@ -250,16 +542,29 @@ class Song(object):
     def get_interpreters(self):
         return self._interpreters
 
+    def is_summary_changed(self):
+        """Check whether unsaved changes affect songbook summaries (title or interpreters)."""
+        return (self._title, list(self._interpreters)) != self._saved_summary
+
+    def is_search_changed(self):
+        """Check whether unsaved changes affect search data (title, authors or interpreters)."""
+        return self._get_search_fields() != self._saved_search
+
+    def mark_saved(self):
+        self._saved_summary = (self._title, list(self._interpreters))
+        self._saved_search = self._get_search_fields()
+
+    def _get_search_fields(self):
+        return (self._title, list(self._authors['lyrics']), list(self._authors['music']),
+                list(self._interpreters))
+
     def set_data(self, data):
         self._title = data['title'] if 'title' in data else self._title
         self._authors = data['authors'] if 'authors' in data else self._authors
         self._interpreters = data['interpreters'] if 'interpreters' in data else self._interpreters
 
         # clear export cache for songs variants
-        variants = g.model.variants.find(song_id=self.get_id())
-        for variant in variants:
-            variant.invalidate_cache()
-            g.model.variants.save(variant)
+        g.model.variants.invalidate_cache_for_song(self.get_id())
 
     def __repr__(self):
         return '<{!r} id={!r} title={!r} interpreters={!r}' \
@@ -0,0 +1,134 @@
+import math
+import datetime
+
+from bson import ObjectId
+from flask import current_app
+from pymongo import DESCENDING
+from pymongo.errors import CollectionInvalid
+
+from server.util import TTLCache
+
+
+def _percentile(values, percent):
+    # nearest-rank percentile of sorted values
+    rank = int(math.ceil(percent / 100 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class ExportStats(object):
+    """Collection for export statistics (timings of export stages).
+
+    Statistics are kept in a capped collection, so only the latest exports
+    are stored and the collection does not need any cleanup.
+
+    Args:
+      model (server.model.Model): Reference to model.
+      db (pymongo.MongoClient): Reference to database.
+
+    Attributes:
+      _model (server.model.Model): Reference to model.
+      _db: Reference to database.
+      _collection: Reference to collection in database for this class.
+    """
+
+    COLLECTION_NAME = 'export_stats'
+
+    # average size of one record in bytes (used for the size of the capped collection)
+    RECORD_SIZE = 1024
+
+    # values aggregated into percentiles besides the export stages
+    VALUES = ('total', 'songs', 'size')
+
+    def __init__(self, model, db):
+        self._model = model
+        self._db = db
+        self._collection = db[self.COLLECTION_NAME]
+
+        self._created = False
+        self._summary = TTLCache(max_size=1)
+
+    def create_collection(self):
+        """Create the capped collection for the statistics (if it does not exist yet).
+
+        Collection is created by the setupdb script, it has to exist before
+        the first insert, otherwise it would not be capped.
+        """
+        count = current_app.config['EXPORT_STATS_COUNT']
+        try:
+            self._db.create_collection(
+                self.COLLECTION_NAME, capped=True, size=count * self.RECORD_SIZE, max=count)
+        except CollectionInvalid:
+            pass
+
+        self._created = True
+
+    def insert(self, data):
+        """Insert statistics of one export into database.
+
+        Args:
+          data (dict): Export statistics (see `server.util.export.export_songbook`).
+        """
+        if not self._created:
+            self.create_collection()
+
+        record = dict(data)
+        record['_id'] = ObjectId()
+        record['created'] = datetime.datetime.utcnow()
+        self._collection.insert_one(record)
+
+    def get_summary(self):
+        """Aggregate statistics of the stored exports.
+
+        Summary is cached for EXPORT_STATS_TTL seconds. Percentiles are
+        computed from the latest EXPORT_STATS_SAMPLE exports only.
+
+        Returns:
+          dict: Number of exports, songbook cache hit rate and 50th and 95th
+            percentile of durations of all export stages (in seconds), of the
+            number of songs and of the exported file size (in bytes).
+        """
+        return self._summary.get('summary', current_app.config['EXPORT_STATS_TTL'],
+                                 self._get_summary)
+
+    def _get_summary(self):
+        totals = list(
+            self._collection.aggregate([{
+                '$group': {
+                    '_id': None,
+                    'count': {'$sum': 1},
+                    'cached': {'$sum': {'$cond': ['$cached', 1, 0]}}
+                }
+            }]))
+        count = totals[0]['count'] if totals else 0
+
+        # values of every stage of the latest exports
+        values = {}
+        for doc in self._collection.aggregate([
+            {'$sort': {'_id': DESCENDING}},
+            {'$limit': current_app.config['EXPORT_STATS_SAMPLE']},
+            {'$project': {'values': {'$concatArrays': [
+                {'$objectToArray': '$timings'},
+                [{'k': key, 'v': '$' + key} for key in self.VALUES]
+            ]}}},
+            {'$unwind': '$values'},
+            {'$group': {'_id': '$values.k', 'values': {'$push': '$values.v'}}}
+        ], allowDiskUse=True): # yapf: disable
+            values[doc['_id']] = doc['values']
+
+        def _summary(data):
+            data = sorted(data)
+            return {
+                'count': len(data),
+                'p50': _percentile(data, 50),
+                'p95': _percentile(data, 95)
+            }
+
+        result = {key: _summary(data) for key, data in values.items() if key in self.VALUES}
+        result['count'] = count
+        result['stages'] = {
+            stage: _summary(data)
+            for stage, data in values.items() if stage not in self.VALUES
+        }
+        result['cache_hits'] = {'songbook': totals[0]['cached'] / count if count else None}
+
+        return result
@@ -1,4 +1,7 @@
 from datetime import datetime
+from flask import current_app
+
+from server.util import TTLCache
 
 
 class Users(object):
@@ -21,6 +24,9 @@ class Users(object):
         self._db = db
         self._collection = db[self.COLLECTION_NAME]
 
+        # logged-in users are loaded on every request
+        self._cache = TTLCache()
+
     def create_user(self, userid, name, active):
         """Create new user and insert him into database.
 
@@ -40,13 +46,34 @@ class Users(object):
             'token': None
         })
         self._collection.insert_one(user.serialize())
+        self._cache.invalidate(userid)
 
         return user
 
     def save(self, user):
         self._collection.update_one({'_id': user.get_id()}, {'$set': user.serialize(update=True)})
+        self._cache.invalidate(user.get_id())
+
+    def clear_cache(self):
+        """Forget all cached users (e.g. after the database was dropped)."""
+        self._cache.clear()
 
     def find(self, user_id):
+        """Find user by his Id.
+
+        Users are cached for USER_CACHE_TTL seconds, changes saved by this
+        process are seen immediately.
+
+        Args:
+          user_id (int): User Id.
+
+        Returns:
+          User: One User or None if he does not exist.
+        """
+        return self._cache.get(user_id, current_app.config['USER_CACHE_TTL'],
+                               lambda: self._find(user_id))
+
+    def _find(self, user_id):
         doc = self._collection.find_one(user_id)
         if not doc:
             return None
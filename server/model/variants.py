@@ -1,16 +1,26 @@
+import logging
+
 from bson import ObjectId
 from flask import g
+from pymongo import ASCENDING
+from pymongo import UpdateOne
 
 from server.util import AppException
 from server.util import SongTemplate
 from server.util import translate_to_tex
+from server.util import strip_tags
 from server.util import validators
+from server.util import VersionedCache
+from server.util import find_one_mapped
+from server.util import discard_mapped
 
 from server.constants import EVENTS
 from server.constants import EXCODES
 from server.constants import STRINGS
 from server.constants import PERMISSION
 
+logger = logging.getLogger(__name__)
+
 
 class Variants(object):
     """Collection for managing CRUD operation in database for variants.
@@ -26,12 +36,16 @@ class Variants(object):
     """
 
     COLLECTION_NAME = 'variants'
+    VERSIONS_COLLECTION_NAME = 'versions'
 
     def __init__(self, model, db):
         self._model = model
         self._db = db
         self._collection = db[self.COLLECTION_NAME]
 
+        # song ids reachable by everyone and song ids of variants owned by each user
+        self._reachable = VersionedCache(db[self.VERSIONS_COLLECTION_NAME])
+
     def create_variant(self, data):
         """Create new variant and insert it into database.
 
@@ -52,7 +66,21 @@ class Variants(object):
             'visibility': data['visibility'],
             'export_cache': None
         })
-        self._collection.insert_one(variant.serialize())
+
+        # add song data used by the full-text search
+        doc = variant.serialize()
+        doc['search'] = {'text': strip_tags(variant.get_text()), 'title': '', 'names': ''}
+
+        song = self._model.songs.find_one(song_id=data['song_id'])
+        if song is not None:
+            doc['search'].update(self._get_song_search_data(song))
+
+        self._collection.insert_one(doc)
+        self._invalidate_reachable(variant, public=variant.get_visibility() >= PERMISSION.PUBLIC)
+
+        if self._model.search is not None:
+            self._model.search.add(variant._id, variant._song_id, variant.get_owner(),
+                                   variant.get_visibility(), doc['search'])
 
         return variant
 
@@ -62,7 +90,196 @@ class Variants(object):
         Args:
           variant (Variant): Instance of the variant.
         """
-        self._collection.update_one({'_id': variant._id}, {'$set': variant.serialize(update=True)})
+        data = variant.serialize(update=True)
+        data['search.text'] = strip_tags(variant.get_text())
+
+        self._collection.update_one({'_id': variant._id}, {'$set': data})
+        discard_mapped(self._collection, variant._id)
+
+        # song of the variant becomes reachable by everyone once the variant gets public
+        if variant.is_visibility_changed(PERMISSION.PUBLIC):
+            self._reachable.invalidate(self._reachable_key())
+
+        if variant.is_summary_changed():
+            self._model.songbooks.update_summary_variant(variant)
+        variant.mark_saved()
+
+        if self._model.search is not None:
+            self._model.search.add(variant._id, variant._song_id, variant.get_owner(),
+                                   variant.get_visibility(), {'text': data['search.text']})
+
+    def update_search(self, song):
+        """Update song data used by the full-text search in all variants of the song.
+
+        Args:
+          song (Song): Instance of the song.
+        """
+        search = self._get_song_search_data(song)
+
+        data = {}
+        for key, value in search.items():
+            data['search.' + key] = value
+
+        self._collection.update_many({'song_id': song._id}, {'$set': data})
+
+        if self._model.search is not None:
+            self._model.search.update_song(song._id, search)
+
+    def invalidate_cache_for_song(self, song_id):
+        """Clear export cache of all variants of the song at once.
+
+        Args:
+          song_id (str): Song ObjectId string.
+
+        Returns:
+          int: Number of variants with cleared export cache.
+        """
+        return self._invalidate_caches({'song_id': ObjectId(song_id)})
+
+    def invalidate_all(self):
+        """Clear export cache of all variants at once.
+
+        Returns:
+          int: Number of variants with cleared export cache.
+        """
+        return self._invalidate_caches({})
+
+    def _invalidate_caches(self, query):
+        query['export_cache'] = {'$ne': None}
+        result = self._collection.update_many(query, {'$set': {'export_cache': None}})
+
+        # loaded variants could contain the old export cache
+        discard_mapped(self._collection)
+        return result.modified_count
+
+    def fill_export_caches(self, variants, strict=True):
+        """Fill empty export caches of given variants at once.
+
+        Songs and interpreters of all uncached variants are loaded by two
+        queries and all export caches are saved by one bulk write.
+
+        Args:
+          variants (list): List of Variant instances.
+          strict (bool, optional): Whether to raise exception for variants, which
+            cannot be translated (otherwise they are skipped).
+
+        Returns:
+          int: Number of filled export caches.
+        """
+        uncached = [variant for variant in variants if variant.get_export_cache() is None]
+        if not uncached:
+            return 0
+
+        songs = {}
+        song_ids = list(set(variant._song_id for variant in uncached))
+        projection = {'title': 1, 'interpreters': 1}
+        for doc in self._db[self._model.songs.COLLECTION_NAME].find({'_id': {'$in': song_ids}},
+                                                                     projection):
+            songs[doc['_id']] = doc
+
+        names = {}
+        interpreter_ids = set(
+            ObjectId(interpreter_id) for song in songs.values()
+            for interpreter_id in song['interpreters'] if ObjectId.is_valid(interpreter_id))
+        for doc in self._db[self._model.interpreters.COLLECTION_NAME].find(
+                {'_id': {'$in': list(interpreter_ids)}}, {'name': 1}):
+            names[str(doc['_id'])] = doc['name']
+
+        requests = []
+        for variant in uncached:
+            if variant._song_id not in songs:
+                if strict:
+                    raise AppException(EVENTS.BASE_EXCEPTION, 404,
+                                       (EXCODES.DOES_NOT_EXIST, STRINGS.SONG_NOT_FOUND_ERROR))
+                logger.warning('Song %s of variant %s was not found.', variant._song_id,
+                               variant._id)
+                continue
+
+            # malformed interpreter ids cannot exist, they are missing as well
+            song = songs[variant._song_id]
+            missing = [x for x in song['interpreters'] if x not in names]
+            if missing:
+                if strict:
+                    raise AppException(
+                        EVENTS.BASE_EXCEPTION, 404,
+                        (EXCODES.DOES_NOT_EXIST, STRINGS.INTERPRETER_NOT_FOUND_ERROR))
+                logger.warning('Interpreters %s of song %s were not found.', missing, song['_id'])
+                continue
+
+            interpreters = [names[interpreter_id] for interpreter_id in song['interpreters']]
+
+            try:
+                variant.fill_export_cache(song['title'], interpreters)
+            except AppException:
+                if strict:
+                    raise
+                continue
+
+            data = {'export_cache': variant.get_export_cache()}
+            requests.append(UpdateOne({'_id': variant._id}, {'$set': data}))
+            discard_mapped(self._collection, variant._id)
+
+        if requests:
+            self._collection.bulk_write(requests, ordered=False)
+
+        return len(requests)
+
+    def count_uncached(self, public_only=False):
+        """Count variants with empty export cache.
+
+        Args:
+          public_only (bool, optional): Whether to count public variants only.
+        """
+        return self._collection.count_documents(self._get_uncached_query(public_only))
+
+    def find_uncached(self, public_only=False, batch_size=100):
+        """Find variants with empty export cache in batches.
+
+        Batches are loaded one by one (ordered by Id), so the export caches
+        can be filled while the variants are being found.
+
+        Args:
+          public_only (bool, optional): Whether to find public variants only.
+          batch_size (int, optional): Number of variants in one batch.
+
+        Yields:
+          list: Batch of Variant instances.
+        """
+        query = self._get_uncached_query(public_only)
+        while True:
+            docs = list(self._collection.find(query).sort('_id', ASCENDING).limit(batch_size))
+            if not docs:
+                return
+
+            yield [Variant(doc) for doc in docs]
+            query['_id'] = {'$gt': docs[-1]['_id']}
+
+    def _get_uncached_query(self, public_only):
+        query = {'export_cache': None}
+        if public_only:
+            query['visibility'] = {'$gte': PERMISSION.PUBLIC}
+        return query
+
+    def build_search_index(self):
+        """Fill in-memory search index with search data of all variants."""
+        projection = {'song_id': 1, 'owner': 1, 'visibility': 1, 'search': 1}
+        for doc in self._collection.find({}, projection):
+            self._model.search.add(doc['_id'], doc['song_id'], doc['owner'], doc['visibility'],
+                                   doc.get('search', {}))
+
+    def _get_song_search_data(self, song):
+        names = []
+        for author_id in song.get_authors()['lyrics'] + song.get_authors()['music']:
+            author = self._model.authors.find_one(author_id=author_id)
+            if author is not None:
+                names.append(author.get_name())
+
+        for interpreter_id in song.get_interpreters():
+            interpreter = self._model.interpreters.find_one(interpreter_id=interpreter_id)
+            if interpreter is not None:
+                names.append(interpreter.get_name())
+
+        return {'title': song.get_title(), 'names': ' '.join(names)}
 
     def delete(self, variant):
         """Delete variant from the database.
@@ -71,6 +288,13 @@ class Variants(object):
           variant (Variant): Instance of the variant.
         """
         self._collection.delete_one({'_id': variant._id})
+        discard_mapped(self._collection, variant._id)
+        self._invalidate_reachable(variant, public=variant.get_visibility() >= PERMISSION.PUBLIC)
+
+        self._model.songbooks.remove_summary_variant(variant)
+
+        if self._model.search is not None:
+            self._model.search.remove(variant._id)
 
     def find(self, song_id=None):
         """Find all variants in the database based on given song id."""
@@ -117,6 +341,46 @@ class Variants(object):
             variants.append(Variant(variant))
         return variants
 
+    def find_filtered_multiple(self, user_id, song_ids):
+        """Find variants of multiple songs based on permissions.
+
+        Args:
+          user_id (str): user Id string.
+          song_ids (list): List of Song ObjectId strings.
+
+        All returned song variants are accessible by this user. Variants of
+        all given songs are loaded with one query.
+
+        Returns:
+          dict: Lists of song Variant instances mapped on song id strings.
+        """
+        query_array = []
+        for song_id in song_ids:
+            query_array.append(ObjectId(song_id))
+
+        doc = self._collection.find({
+            '$and': [{
+                'song_id': {
+                    '$in': query_array
+                }
+            }, {
+                '$or': [{
+                    'owner': user_id
+                }, {
+                    'visibility': {
+                        "$gte": PERMISSION.PUBLIC
+                    }
+                }]
+            }]
+        })
+
+        variants = {}
+        for song_id in song_ids:
+            variants[str(song_id)] = []
+        for variant in doc:
+            variants[str(variant['song_id'])].append(Variant(variant))
+        return variants
+
     def find_one(self, variant_id=None):
         """Find one song variant based on given arguments.
 
@@ -130,36 +394,51 @@ class Variants(object):
         if variant_id is not None:
             query['_id'] = ObjectId(variant_id)
 
-        doc = self._collection.find_one(query)
-        if not doc:
-            return None
+        return find_one_mapped(self._collection, query, Variant)
 
-        return Variant(doc)
-
-    def find_reachable_song_ids(self, user_id):
+    def find_reachable_song_ids(self, user_id, song_ids=None):
         """Find song_ids of variants reachable by given user.
 
         Args:
           user_id (str): user Id string.
+          song_ids (list, optional): List of song ObjectIds the result is limited to.
+
+        Song ids reachable by everyone and song ids reachable only by the owner
+        are cached separately and recomputed only after a variant change,
+        which affects them.
 
         Returns:
           list: List of song ids which have some variants for given user.
         """
-        doc = self._db.command({
-            "distinct": self.COLLECTION_NAME,
-            "query": {
-                '$or': [{
-                    'owner': user_id
-                }, {
-                    'visibility': {
-                        "$gte": PERMISSION.PUBLIC
-                    }
-                }]
-            },
-            "key": "song_id"
-        })
+        public_key = self._reachable_key()
+        owner_key = self._reachable_key(user_id)
+        versions = self._reachable.get_versions([public_key, owner_key])
 
-        return doc['values']
+        reachable = self._reachable.get(
+            public_key, versions[public_key],
+            lambda: self._find_distinct_song_ids({'visibility': {'$gte': PERMISSION.PUBLIC}}))
+        reachable = reachable | self._reachable.get(
+            owner_key, versions[owner_key],
+            lambda: self._find_distinct_song_ids({'owner': user_id}))
+
+        if song_ids is None:
+            return list(reachable)
+
+        return [song_id for song_id in song_ids if song_id in reachable]
+
+    def _find_distinct_song_ids(self, query):
+        doc = self._db.command({"distinct": self.COLLECTION_NAME, "query": query, "key": "song_id"})
+        return frozenset(doc['values'])
+
+    def _reachable_key(self, user_id=None):
+        if user_id is None:
+            return 'reachable_songs'
+        return 'reachable_songs_{}'.format(user_id)
+
+    def _invalidate_reachable(self, variant, public):
+        self._reachable.invalidate(self._reachable_key(variant.get_owner()))
+        if public:
+            self._reachable.invalidate(self._reachable_key())
 
     def find_extended_songbook_items(self, items):
         query_array = []
@@ -228,6 +507,10 @@ class Variant(object):
         self._visibility = variant['visibility']
         self._export_cache = variant['export_cache']
 
+        # visibility and title stored in the database
+        self._saved_visibility = self._visibility
+        self._saved_title = self._title
+
     def serialize(self, update=False):
         """Serialize variant data for database operations.
 
@@ -287,6 +570,21 @@ class Variant(object):
     def get_visibility(self):
         return self._visibility
 
+    def get_export_cache(self):
+        return self._export_cache
+
+    def is_visibility_changed(self, threshold):
+        """Check whether unsaved visibility change crosses given visibility level."""
+        return (self._visibility >= threshold) != (self._saved_visibility >= threshold)
+
+    def is_summary_changed(self):
+        """Check whether unsaved changes affect songbook summaries (title or visibility)."""
+        return self._title != self._saved_title or self._visibility != self._saved_visibility
+
+    def mark_saved(self):
+        self._saved_visibility = self._visibility
+        self._saved_title = self._title
+
     def _handle_permissions(self, visibility):
         if visibility not in PERMISSION:
             raise AppException(EVENTS.REQUEST_EXCEPTION, 422,
@@ -320,27 +618,35 @@ class Variant(object):
             # get parent song of this variant
             song = g.model.songs.find_one(song_id=str(self._song_id))
 
-            # translate song lyrics and chords to tex output (error throws exception)
-            latex_output = validators.song_format({'text': self._text})
-
             # get all interpreters of this song
             interpreters = []
             for interpreter_id in song.get_interpreters():
                 interpreter = g.model.interpreters.find_one(interpreter_id=interpreter_id)
                 interpreters.append(interpreter.get_name())
 
-            # save variant to export cache
-            self._export_cache = {
-                'title': song.get_title(),
-                'interpreters': interpreters,
-                'song': latex_output
-            }
+            self.fill_export_cache(song.get_title(), interpreters)
 
             # save cached song into the database
             g.model.variants.save(self)
 
         return SongTemplate(self._export_cache)
 
+    def fill_export_cache(self, title, interpreters):
+        """Translate variant into the LaTeX format and save it to export cache.
+
+        Args:
+          title (str): Title of the variant song.
+          interpreters (list): Names of the song interpreters.
+        """
+        # translate song lyrics and chords to tex output (error throws exception)
+        latex_output = validators.song_format({'text': self._text})
+
+        self._export_cache = {
+            'title': title,
+            'interpreters': interpreters,
+            'song': latex_output
+        }
+
     def __repr__(self):
         return '<{!r} id={!r} owner={!r} _description={!r}' \
             .format(self.__class__.__name__, self._id, self._owner, self._description)
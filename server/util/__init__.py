@@ -1,9 +1,32 @@
 from server.util.export import export_songbook
+from server.util.export import cleanup_formats
+
+from server.util.jobs import enqueue_export_job
+from server.util.jobs import resume_export_jobs
+from server.util.jobs import resume_stale_export_job
 
 from server.util.misc import generate_random_filename
 from server.util.misc import log_event
+from server.util.misc import ndjson_response
+from server.util.misc import StageTimer
+
+from server.util.pagination import split_page
+from server.util.pagination import keyset_query
+from server.util.pagination import keyset_filter
+from server.util.pagination import page_in_memory
+from server.util.pagination import load_in_order
+from server.util.pagination import encode_cursor
+from server.util.pagination import decode_cursor
+
+from server.util.cache import VersionedCache
+from server.util.cache import TTLCache
+from server.util.identity import find_one_mapped
+from server.util.identity import discard_mapped
+from server.util.fuzzy import FuzzyIndex
 
 from server.util.translator import translate_to_tex
+from server.util.translator import translate_many
+from server.util.translator import strip_tags
 from server.util.exceptions import AppException
 from server.util.structures import ConstantDict
 
@@ -0,0 +1,132 @@
+import time
+import threading
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from collections import OrderedDict
+
+
+class VersionedCache(object):
+    """In-memory cache of values computed from the database.
+
+    Every cached value has a version stored in the database, which is changed
+    whenever the value is invalidated (by any process). Value is recomputed
+    once its stored version differs from the cached one. Initial version is
+    stored on the first read of the value.
+
+    Args:
+      collection: Reference to collection in database for the versions.
+      max_size (int, optional): Maximum number of cached values.
+    """
+
+    def __init__(self, collection, max_size=1024):
+        self._collection = collection
+        self._max_size = max_size
+
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+
+    def get_versions(self, keys):
+        """Get current versions of given keys (initial versions are stored if there are none)."""
+        versions = dict.fromkeys(keys)
+        for doc in self._collection.find({'_id': {'$in': list(keys)}}):
+            versions[doc['_id']] = doc['version']
+
+        # version, which was stored meanwhile by other process, is kept
+        for key in [key for key, version in versions.items() if version is None]:
+            doc = self._collection.find_one_and_update(
+                {'_id': key}, {'$setOnInsert': {'version': ObjectId()}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+            versions[key] = doc['version']
+
+        return versions
+
+    def get(self, key, version, compute):
+        """Get cached value of given version or compute and cache it.
+
+        Args:
+          key (str): Key of the value.
+          version: Current version of the value (see `get_versions`), value
+            without any version is not cached.
+          compute (callable): Function computing the value.
+        """
+        with self._lock:
+            if version is not None and key in self._values and self._values[key][0] == version:
+                self._values.move_to_end(key)
+                return self._values[key][1]
+
+        value = compute()
+        if version is None:
+            return value
+
+        with self._lock:
+            self._values[key] = (version, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_size:
+                self._values.popitem(last=False)
+
+        return value
+
+    def invalidate(self, key):
+        """Invalidate value with given key in all processes."""
+        self._collection.update_one({'_id': key}, {'$set': {'version': ObjectId()}}, upsert=True)
+
+
+class TTLCache(object):
+    """Thread-safe in-memory cache of values expiring after given age.
+
+    Values computed while any value was invalidated are not cached, so
+    invalidation is never overwritten by a value computed before it.
+
+    Args:
+      max_size (int, optional): Maximum number of cached values.
+    """
+
+    def __init__(self, max_size=1024):
+        self._max_size = max_size
+
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        self._generation = 0
+
+    def get(self, key, max_age, compute):
+        """Get cached value not older than given age or compute and cache it.
+
+        Args:
+          key: Key of the value.
+          max_age (int): Maximal age of the cached value in seconds.
+          compute (callable): Function computing the value (None values are not cached).
+        """
+        now = time.time()
+        with self._lock:
+            if key in self._values and now - self._values[key][0] < max_age:
+                self._values.move_to_end(key)
+                return self._values[key][1]
+            generation = self._generation
+
+        value = compute()
+        if value is None or max_age <= 0:
+            return value
+
+        with self._lock:
+            if generation != self._generation:
+                return value
+
+            self._values[key] = (now, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self._max_size:
+                self._values.popitem(last=False)
+
+        return value
+
+    def invalidate(self, key):
+        """Remove value with given key from the cache."""
+        with self._lock:
+            self._values.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        """Remove all values from the cache."""
+        with self._lock:
+            self._values.clear()
+            self._generation += 1
@@ -1,10 +1,23 @@
 import os
+import json
+import math
+import time
+import logging
+import hashlib
 import pystache
 import subprocess
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g
+from pymongo.errors import PyMongoError
+
 from server.app import app
 from server.util import validators
+from server.util.misc import file_lock
 from server.util.misc import generate_random_filename
+from server.util.misc import StageTimer
 from server.util.exceptions import AppException
 
 from server.constants import EVENTS
@@ -12,84 +25,645 @@ from server.constants import EXCODES
 from server.constants import STRINGS
 from server.constants import DEFAULTS
 
+logger = logging.getLogger(__name__)
+
+# formats, which cannot be built, and time of their failure (they are tried again later)
+_failed_formats = {}
+
+# modification times of the export templates and hash of their contents
+_template_hash = (None, None)
+
+
+def export_songbook(songbook, progress=None, job_id=None, heartbeat=None):
+    """Export songbook into the pdf file.
+
+    Duration of all export stages, number of songs, size of the exported
+    file and cache hits are measured and stored in the export statistics.
+
+    Args:
+      songbook (Songbook): Exported songbook.
+      progress (callable, optional): Function called with export progress (in percents).
+      job_id (str, optional): Id of the export job running the export.
+      heartbeat (callable, optional): Function called periodically while the export
+        waits for other export of the same content.
+
+    Returns:
+      dict: Link to the exported file, log (kept for compatibility, always empty),
+        compilation passes (empty if no compilation was needed) and export statistics.
+    """
+    timer = StageTimer()
 
-def export_songbook(songbook):
     # check if songbook is cached
     if songbook.is_cached():
         filename = songbook.get_cached_file(extend=True)
 
         # check if file really exists
         if os.path.isfile(app.config['SONGBOOK_DONE_FOLDER'] + filename + ".pdf"):
-            return {'link': "download/{}.pdf".format(filename), 'log': {}}
-
-    # start export process
-    filename = generate_random_filename()
+            stats = _save_stats(songbook, job_id, filename, timer, cached=True)
+            return {
+                'link': "download/{}.pdf".format(filename),
+                'log': {},
+                'passes': [],
+                'stats': stats
+            }
 
     # create instance of pystache renderer
     renderer = pystache.Renderer(string_encoding='utf-8', search_dirs=app.config['SONGBOOK_TEMPLATE_FOLDER'])
 
-    # generate song sbd file
-    with open(app.config['SONGBOOK_TEMP_FOLDER'] + filename + '.sbd', 'ab') as file:
-        for song_obj in songbook.get_songs():
-            variant = validators.song_variant_existence(song_obj['variant_id'])
+    # translate all uncached variants at once (instead of one by one in get_output_template)
+    with timer.measure('database'):
+        variants = [
+            validators.song_variant_existence(song_obj['variant_id'])
+            for song_obj in songbook.get_songs()
+        ]
+        filled = g.model.variants.fill_export_caches(variants)
+
+    # render all songs of the songbook (songs are not cached one by one, rendering is cheap
+    # and xelatex cannot reuse layout of single songs, whole exported files are cached instead)
+    fragments = []
+    for variant in variants:
+        with timer.measure('database'):
             template = variant.get_output_template()
-            file.write(renderer.render(template).encode('utf8'))
 
-    # generate songbook tex file
-    with open(app.config['SONGBOOK_TEMP_FOLDER'] + filename + '.tex', 'wb') as file:
-        template = songbook.get_output_template()
-        template.set_filename(filename)
-        file.write(renderer.render(template).encode('utf8'))
+        with timer.measure('render'):
+            fragments.append(renderer.render(template))
 
-    # export songbook to pdf file
-    link = export_to_pdf(filename)
+    # songbook template injects default values into the songbook options
+    template = songbook.get_output_template()
+
+    # exported file is named by songbook content, so that songbooks
+    # with the same content share the same exported file
+    filename = get_content_hash(songbook.get_options(), fragments)
+
+    # very large songbooks are compiled in chunks in parallel
+    split = 0 < app.config['EXPORT_SPLIT_SONGS'] <= len(fragments) and \
+        app.config['EXPORT_SPLIT_WORKERS'] > 1
+
+    fmt = None
+    passes = []
+    if not os.path.isfile(app.config['SONGBOOK_DONE_FOLDER'] + filename + ".pdf"):
+        # concurrent exports of the same content (e.g. double-clicked export) are compiled
+        # only once, the others wait for it and share its file
+        lock = app.config['SONGBOOK_TEMP_FOLDER'] + 'export-' + filename + '.lock'
+        with file_lock(lock, on_wait=heartbeat):
+            # file could be exported by other process while this one was waiting for the lock
+            if not os.path.isfile(app.config['SONGBOOK_DONE_FOLDER'] + filename + ".pdf"):
+                fmt, passes = _export_content(songbook, filename, fragments, template, renderer,
+                                              split, progress, timer)
 
     # cache songbook
     songbook.cache_file(filename)
-    return {'link': link}
 
+    # songbook is recorded as split only if it was compiled by this export
+    stats = _save_stats(songbook, job_id, filename, timer, cached=False, passes=passes,
+                        export_caches=filled, split=split and bool(passes),
+                        precompiled=fmt is not None)
+    return {
+        'link': "download/{}.pdf".format(filename),
+        'log': {},
+        'passes': passes,
+        'stats': stats
+    }
 
-def export_to_pdf(filename):
 
-    def error(err, output):
-        error = "Error during " + err + ":\n"
-        for line in output.decode('latin-1').split("\n"):
-            if line.startswith("!"):
-                error += line + "\n"
+def _export_content(songbook, filename, fragments, template, renderer, split, progress, timer):
+    if split:
+        with timer.measure('format'):
+            fmt = get_format(template, renderer)
 
-        raise AppException(EVENTS.COMPILATION_EXCEPTION, 500,
-                           (EXCODES.COMPILATION_ERROR, STRINGS.COMPILATION_ERROR, error))
+        passes = export_to_pdf_split(filename, fragments, template, renderer, progress=progress,
+                                     index=songbook.get_options()['index'], fmt=fmt, timer=timer)
+        return fmt, passes
 
-    process = subprocess.Popen(
-        [app.config['XELATEX_PATH'], "-halt-on-error", filename + ".tex"],
-        stdout=subprocess.PIPE,
-        cwd=app.config['SONGBOOK_TEMP_FOLDER'])
-    output = process.communicate()[0]
-    exit_code = process.wait()
+    with timer.measure('render'):
+        # generate song sbd file
+        with open(app.config['SONGBOOK_TEMP_FOLDER'] + filename + '.sbd', 'wb') as file:
+            for fragment in fragments:
+                file.write(fragment.encode('utf8'))
 
-    if exit_code:
-        error("pdf compilation", output)
+        # generate songbook tex file
+        with open(app.config['SONGBOOK_TEMP_FOLDER'] + filename + '.tex', 'wb') as file:
+            template.set_filename(filename)
+            file.write(renderer.render(template).encode('utf8'))
+
+    # report export progress (in percents) if anyone is interested
+    if progress is not None:
+        progress(20)
+
+    # index of songbook with the same songs (and options) can be reused between exports
+    index_key = get_content_hash(songbook.get_options(),
+                                 [song_obj['variant_id'] for song_obj in songbook.get_songs()])
+
+    with timer.measure('format'):
+        fmt = get_format(template, renderer)
+
+    # export songbook to pdf file
+    passes = export_to_pdf(filename, progress=progress, index=songbook.get_options()['index'],
+                           index_key=index_key, fmt=fmt, timer=timer, songs=len(fragments))
+
+    return fmt, passes
+
+
+def _save_stats(songbook, job_id, filename, timer, cached, passes=(), export_caches=0,
+                split=False, precompiled=False):
+    stats = {
+        'songbook_id': songbook.get_id(),
+        'job_id': job_id,
+        'songs': len(songbook.get_songs()),
+        'size': os.path.getsize(app.config['SONGBOOK_DONE_FOLDER'] + filename + '.pdf'),
+        'cached': cached,
+        'export_caches': export_caches,
+        'format': precompiled,
+        'split': split,
+        'passes': list(passes),
+        'timings': timer.timings,
+        'total': timer.total()
+    }
+
+    # statistics are not worth failing the export
+    try:
+        g.model.export_stats.insert(stats)
+    except PyMongoError:
+        logger.exception('Export statistics of songbook %s cannot be saved.', songbook.get_id())
+
+    return stats
+
+
+def get_format(template, renderer):
+    """Get precompiled format of the songbook preamble (build it on the first use).
+
+    Packages loaded by the songbook preamble depend on the paper format and
+    the chords option only, so they are dumped into the format and xelatex
+    does not have to load them for every compilation. Fonts cannot be dumped
+    by XeTeX, they are loaded after the dumped part of the preamble. Formats
+    are named by the hash of the dumped preamble and the songs package, so
+    they are rebuilt once any of them changes.
+
+    Args:
+      template (SongbookTemplate): Template of the songbook.
+      renderer (pystache.Renderer): Renderer of the templates.
+
+    Returns:
+      str: Absolute path of the format (without the extension) or None if
+        the formats are disabled or the format cannot be built.
+    """
+    if not app.config['EXPORT_PRECOMPILED_FORMAT']:
+        return None
+
+    folder = app.config['SONGBOOK_FORMAT_FOLDER']
+    preamble = renderer.render_name('songbook_format', template)
+
+    # songs package is loaded from the parent folder (see the preamble)
+    key = hashlib.sha256(preamble.encode('utf8'))
+    with open(os.path.join(folder, os.pardir, 'songs.sty'), 'rb') as file:
+        key.update(file.read())
+
+    name = 'songbook-' + key.hexdigest()
+    if time.time() - _failed_formats.get(name, 0) < app.config['EXPORT_FORMAT_RETRY']:
+        return None
+
+    if not os.path.isfile(folder + name + '.fmt'):
+        try:
+            built = _build_format(folder, name, preamble)
+        except OSError:
+            logger.exception('Precompiled format %s cannot be built.', name)
+            built = False
+
+        if not built:
+            _failed_formats[name] = time.time()
+            return None
+        _failed_formats.pop(name, None)
+
+    # mark format as recently used (see `cleanup_formats`)
+    try:
+        os.utime(folder + name + '.fmt')
+    except FileNotFoundError:
+        return None
+
+    return os.path.abspath(folder + name)
+
+
+def cleanup_formats():
+    """Remove precompiled formats, which were not used for a long time.
+
+    Formats of changed preambles (or songs package) are never used again,
+    leftovers of interrupted format builds are removed as well.
+    """
+    folder = app.config['SONGBOOK_FORMAT_FOLDER']
+    if not os.path.isdir(folder):
+        return
+
+    max_age = app.config['EXPORT_FORMAT_AGE'] * 24 * 60 * 60
+    for entry in os.scandir(folder):
+        try:
+            if time.time() - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _build_format(folder, name, preamble):
+    os.makedirs(folder, exist_ok=True)
+
+    # format is built under unique name as other processes (and threads) may build it as well
+    jobname = '{}-{}'.format(name, generate_random_filename())
+    with open(folder + jobname + '.tex', 'wb') as file:
+        file.write(preamble.encode('utf8'))
+        file.write(b'\n\\csname endofdump\\endcsname\n')
+
+    try:
+        exit_code, output = _run_process(
+            [app.config['XELATEX_PATH'], "-ini", "-halt-on-error", "-jobname=" + jobname,
+             "&xelatex", "mylatexformat.ltx", jobname + ".tex"], folder)
+
+        if not exit_code:
+            # format is moved into place atomically, so it is never used half written
+            os.replace(folder + jobname + '.fmt', folder + name + '.fmt')
+        else:
+            logger.warning('Precompiled format %s cannot be built:\n%s', name, output.get_log())
+    finally:
+        for fname in os.listdir(folder):
+            if fname.startswith(jobname):
+                os.remove(os.path.join(folder, fname))
+
+    return not exit_code
+
+
+def get_template_hash():
+    """Compute hash of the export templates and the songs package.
+
+    Exported file depends on them as much as on the songbook content, so
+    their hash is part of the content hash. Hash is computed again only
+    once any of the files is modified.
+
+    Returns:
+      bytes: Hash digest.
+    """
+    global _template_hash
+
+    # songs package is stored in the parent folder of the templates
+    folder = app.config['SONGBOOK_TEMPLATE_FOLDER']
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+    paths.append(os.path.join(folder, os.pardir, 'songs.sty'))
+
+    mtimes = [(path, os.stat(path).st_mtime_ns) for path in paths]
+    if _template_hash[0] != mtimes:
+        template_hash = hashlib.sha256()
+        for path in paths:
+            with open(path, 'rb') as file:
+                data = file.read()
+            header = '\n{}\n{}\n'.format(os.path.basename(path), len(data))
+            template_hash.update(header.encode('utf8'))
+            template_hash.update(data)
+
+        _template_hash = (mtimes, template_hash.digest())
+
+    return _template_hash[1]
+
+
+def get_content_hash(options, fragments):
+    """Compute hash of the songbook content.
+
+    Hash includes the export templates and the songs package as well (see
+    `get_template_hash`), so that files exported by their older versions
+    are not reused.
+
+    Args:
+      options (dict): Songbook options.
+      fragments (list): Rendered songs of the songbook (in songbook order).
+
+    Returns:
+      str: Hexadecimal hash digest.
+    """
+    content_hash = hashlib.sha256(get_template_hash())
+    content_hash.update(json.dumps(options, sort_keys=True).encode('utf8'))
+
+    # prefix each fragment with its length so that fragment boundaries matter
+    for fragment in fragments:
+        data = fragment.encode('utf8')
+        content_hash.update('\n{}\n'.format(len(data)).encode('utf8'))
+        content_hash.update(data)
+
+    return content_hash.hexdigest()
+
+
+def export_to_pdf(filename, progress=None, index=True, index_key=None, fmt=None, timer=None,
+                  songs=None):
+    """Compile songbook tex file into the pdf file.
+
+    Second xelatex pass is needed only for the songbook index. It is skipped
+    if the index is disabled or if the index generated by the first pass is
+    the same as the index from the previous export of the same song set
+    (which was used during the first pass).
+
+    Args:
+      filename (str): Name of the songbook tex file (without the extension).
+      progress (callable, optional): Function called with export progress (in percents).
+      index (bool, optional): Whether songbook contains index.
+      index_key (str, optional): Key of the song set for reusing its index.
+      fmt (str, optional): Path of the precompiled format (see `get_format`).
+      timer (StageTimer, optional): Timer measuring duration of the passes.
+      songs (int, optional): Number of songs (progress is reported after each song).
+
+    Returns:
+      list: Names of compilation passes, which were run.
+    """
+    if timer is None:
+        timer = StageTimer()
+
+    def compile_tex(start, end):
+        _run_pass('xelatex', passes, timer, _run_xelatex, filename, fmt,
+                  _song_progress(progress, songs, start, end))
+
+    passes = []
+    index_file = app.config['SONGBOOK_TEMP_FOLDER'] + filename + '.sbx'
 
-    process = subprocess.Popen(
-        ["../songidx", filename + ".sxd", filename + ".sbx"],
-        stdout=subprocess.PIPE,
-        cwd=app.config['SONGBOOK_TEMP_FOLDER'])
-    output = process.communicate()[0]
-    exit_code = process.wait()
+    # use index from the previous export of the same song set in the first pass
+    cached_index = None
+    if index and index_key is not None:
+        os.makedirs(app.config['SONGBOOK_INDEX_FOLDER'], exist_ok=True)
+        cached_file = app.config['SONGBOOK_INDEX_FOLDER'] + index_key + '.sbx'
+        if os.path.isfile(cached_file):
+            with open(cached_file, 'rb') as file:
+                cached_index = file.read()
+            with open(index_file, 'wb') as file:
+                file.write(cached_index)
 
+    compile_tex(20, 60)
+
+    if progress is not None:
+        progress(60)
+
+    if index:
+        _run_pass('songidx', passes, timer, _run_songidx, filename)
+
+        if progress is not None:
+            progress(70)
+
+        with open(index_file, 'rb') as file:
+            generated_index = file.read()
+
+        # second pass cannot change anything if the first pass already used the same index
+        if generated_index != cached_index:
+            compile_tex(70, 95)
+
+            if index_key is not None:
+                with open(app.config['SONGBOOK_INDEX_FOLDER'] + index_key + '.sbx', 'wb') as file:
+                    file.write(generated_index)
+
+    _finish_export(filename)
+    return passes
+
+
+def export_to_pdf_split(filename, fragments, template, renderer, progress=None, index=True,
+                        fmt=None, timer=None):
+    """Compile songbook in chunks of songs in parallel and merge them into the pdf file.
+
+    Songs are split into one chunk per worker and every chunk is compiled
+    as a separate document. Page offsets of the chunks are not known before
+    they are typeset, so chunks are measured first by a draft pass (xelatex
+    without the pdf output), their layout does not depend on the first page.
+    Draft of the songbook frame (title page and front index) then reports
+    the page where songs start. Every chunk is compiled just once at its
+    final offset and the frame includes the chunk pdf files with their
+    merged index.
+
+    Args:
+      filename (str): Name of the songbook files (without the extension).
+      fragments (list): Rendered songs of the songbook (in songbook order).
+      template (SongbookTemplate): Template of the songbook.
+      renderer (pystache.Renderer): Renderer of the templates.
+      progress (callable, optional): Function called with export progress (in percents).
+      index (bool, optional): Whether songbook contains index.
+      fmt (str, optional): Path of the precompiled format (see `get_format`).
+      timer (StageTimer, optional): Timer measuring duration of the passes.
+
+    Returns:
+      list: Names of compilation passes, which were run.
+    """
+    if timer is None:
+        timer = StageTimer()
+
+    folder = app.config['SONGBOOK_TEMP_FOLDER']
+    workers = app.config['EXPORT_SPLIT_WORKERS']
+    passes = []
+
+    size = int(math.ceil(len(fragments) / workers))
+    chunks = []
+    for start in range(0, len(fragments), size):
+        chunk = {
+            'name': '{}-{}'.format(filename, len(chunks)),
+            'first_page': 1,
+            'first_song': start + 1
+        }
+        with open(folder + chunk['name'] + '.sbd', 'wb') as file:
+            for fragment in fragments[start:start + size]:
+                file.write(fragment.encode('utf8'))
+        chunks.append(chunk)
+
+    def compile_chunks(name, draft):
+        for chunk in chunks:
+            template.set_chunk(chunk['name'], chunk['first_page'], chunk['first_song'])
+            with open(folder + chunk['name'] + '.tex', 'wb') as file:
+                file.write(renderer.render_name('chunk_template', template).encode('utf8'))
+
+        def run_chunks():
+            # xelatex runs in its own process, so threads are enough to use all cores
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(
+                    executor.map(lambda chunk: _run_xelatex(chunk['name'], fmt, draft=draft),
+                                 chunks))
+
+        return _run_pass(name, passes, timer, run_chunks)
+
+    def compile_frame(name, chunk_names, draft, with_index):
+        template.set_filename(filename)
+        template.set_chunks(chunk_names)
+        with open(folder + filename + '.tex', 'wb') as file:
+            file.write(renderer.render(template).encode('utf8'))
+
+        if with_index:
+            # index entries of all chunks are merged into one index
+            with open(folder + filename + '.sxd', 'wb') as merged:
+                for i, chunk in enumerate(chunks):
+                    with open(folder + chunk['name'] + '.sxd', 'rb') as file:
+                        header, _, entries = file.read().partition(b'\n')
+                    if i == 0:
+                        merged.write(header + b'\n')
+                    merged.write(entries)
+
+            _run_pass('songidx', passes, timer, _run_songidx, filename)
+
+        output = _run_pass(name, passes, timer, _run_xelatex, filename, fmt, None, draft)
+        return output.next_page
+
+    # measuring pass, chunks are typeset from the first page
+    for chunk, output in zip(chunks, compile_chunks('xelatex-measure', True)):
+        chunk['pages'] = output.next_page - 1
+
+    if progress is not None:
+        progress(30)
+
+    # frame without chunks reports the first page of songs, front index has its final length
+    # already (page numbers of its entries do not matter yet)
+    first_page = compile_frame('xelatex-measure', [], True, index and template.front_index())
+    for chunk in chunks:
+        chunk['first_page'] = first_page
+        first_page += chunk['pages']
+
+    if progress is not None:
+        progress(40)
+
+    compile_chunks('xelatex-chunks', False)
+
+    if progress is not None:
+        progress(80)
+
+    compile_frame('xelatex', [chunk['name'] for chunk in chunks], False, index)
+
+    _finish_export(filename)
+    return passes
+
+
+def _run_pass(name, passes, timer, function, *args):
+    # repeated passes are measured separately (e.g. xelatex_1 and xelatex_2)
+    with timer.measure('{}_{}'.format(name, passes.count(name) + 1)):
+        result = function(*args)
+
+    passes.append(name)
+    return result
+
+
+class CompilerOutput(object):
+    """Line by line parser of the compiler output.
+
+    Output is parsed while the compiler is running and only the parsed data
+    and a few last lines are kept. Songs report themselves once they are
+    typeset and compiled documents report page following their songs (see
+    the song and songbook templates).
+
+    Args:
+      on_song (callable, optional): Function called with the number of typeset songs.
+
+    Attributes:
+      errors (list): Lines of the first error (error message and its context).
+      songs (int): Number of typeset songs.
+      next_page (int): Page following the compiled songs.
+      tail (collections.deque): Last lines of the output.
+    """
+
+    # maximal number of lines of the error context
+    ERROR_LINES = 10
+
+    def __init__(self, on_song=None):
+        self._on_song = on_song
+        self.errors = []
+        self.songs = 0
+        self.next_page = 1
+        self.tail = deque(maxlen=20)
+
+    def feed(self, line):
+        """Parse one line of the output.
+
+        Args:
+          line (bytes): Line of the output.
+
+        Returns:
+          bool: True once the whole fatal error was read (compiler can be stopped).
+        """
+        self.tail.append(line)
+
+        if self.errors:
+            # error context ends with the line where the error occured
+            self.errors.append(line.decode('latin-1').rstrip())
+            return line.startswith(b'l.') or len(self.errors) >= self.ERROR_LINES
+
+        if line.startswith(b'!'):
+            self.errors.append(line.decode('latin-1').rstrip())
+
+        elif line.startswith(b'ZPEVNIK-SONG'):
+            self.songs += 1
+            if self._on_song is not None:
+                self._on_song(self.songs)
+
+        elif line.startswith(b'ZPEVNIK-NEXT-PAGE='):
+            self.next_page = int(line.split(b'=')[1])
+
+        return False
+
+    def get_log(self):
+        """Get the error (or the last lines of the output if there is no error)."""
+        if self.errors:
+            return '\n'.join(self.errors)
+
+        return '\n'.join(line.decode('latin-1').rstrip() for line in self.tail)
+
+
+def _run_process(command, cwd, on_song=None):
+    parser = CompilerOutput(on_song)
+
+    with subprocess.Popen(command, stdout=subprocess.PIPE, cwd=cwd) as process:
+        for line in process.stdout:
+            # rest of the compilation is useless after the first fatal error
+            if parser.feed(line):
+                process.kill()
+                break
+
+        exit_code = process.wait()
+
+    return exit_code, parser
+
+
+def _song_progress(progress, songs, start, end):
+    # compilation progress is reported only when it changes (at most once per percent)
+    if progress is None or not songs:
+        return None
+
+    last = start
+
+    def _on_song(count):
+        nonlocal last
+
+        value = start + (end - start) * min(count, songs) // songs
+        if value != last:
+            last = value
+            progress(value)
+
+    return _on_song
+
+
+def _compilation_error(err, output):
+    error = "Error during " + err + ":\n" + output.get_log() + "\n"
+
+    raise AppException(EVENTS.COMPILATION_EXCEPTION, 500,
+                       (EXCODES.COMPILATION_ERROR, STRINGS.COMPILATION_ERROR, error))
+
+
+def _run_xelatex(filename, fmt=None, on_song=None, draft=False):
+    command = [app.config['XELATEX_PATH'], "-halt-on-error"]
+    if fmt is not None:
+        command.append('-fmt=' + fmt)
+
+    # draft only typesets the document (and writes its aux files) without the pdf output
+    if draft:
+        command.append('-no-pdf')
+
+    exit_code, output = _run_process(command + [filename + ".tex"],
+                                     app.config['SONGBOOK_TEMP_FOLDER'], on_song)
     if exit_code:
-        error("index generation", output)
+        _compilation_error("pdf compilation", output)
+
+    return output
 
-    process = subprocess.Popen(
-        [app.config['XELATEX_PATH'], "-halt-on-error", filename + ".tex"],
-        stdout=subprocess.PIPE,
-        cwd=app.config['SONGBOOK_TEMP_FOLDER'])
-    output = process.communicate()[0]
-    exit_code = process.wait()
 
+def _run_songidx(filename):
+    exit_code, output = _run_process(["../songidx", filename + ".sxd", filename + ".sbx"],
+                                     app.config['SONGBOOK_TEMP_FOLDER'])
     if exit_code:
-        error("pdf compilation", output)
+        _compilation_error("index generation", output)
 
+
+def _finish_export(filename):
     # move finished pdf file to other folder and clean up temp
     os.rename(app.config['SONGBOOK_TEMP_FOLDER'] + filename + '.pdf',
               app.config['SONGBOOK_DONE_FOLDER'] + filename + '.pdf')
@@ -98,5 +672,3 @@ def export_to_pdf(filename):
     for fname in os.listdir(app.config['SONGBOOK_TEMP_FOLDER']):
         if fname.startswith(filename):
             os.remove(os.path.join(app.config['SONGBOOK_TEMP_FOLDER'], fname))
-
-    return "download/{}.pdf".format(filename)
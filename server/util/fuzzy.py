@@ -0,0 +1,199 @@
+import time
+import threading
+
+from collections import Counter
+
+from server.util.search import tokenize
+
+
+def trigrams(text):
+    """Get set of trigrams of all words of the text (words are padded by spaces)."""
+    result = set()
+    for word in tokenize(text):
+        word = '  {} '.format(word)
+        for i in range(len(word) - 2):
+            result.add(word[i:i + 3])
+
+    return result
+
+
+def typo_distance(first, second, maximum):
+    """Get Damerau-Levenshtein distance (optimal string alignment) of two strings.
+
+    Computation is stopped once the distance exceeds the maximum, `maximum + 1`
+    is returned in such case.
+    """
+    if abs(len(first) - len(second)) > maximum:
+        return maximum + 1
+
+    previous, current = None, list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        earlier, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = 0 if first[i - 1] == second[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and first[i - 1] == second[j - 2] and
+                    first[i - 2] == second[j - 1]):
+                current[j] = min(current[j], earlier[j - 2] + 1)
+
+        if min(current) > maximum:
+            return maximum + 1
+
+    return min(current[-1], maximum + 1)
+
+
+def allowed_typos(text):
+    """Get number of typos tolerated in the text of given length."""
+    if len(text) < 4:
+        return 0
+    return 1 if len(text) < 9 else 2
+
+
+class FuzzyIndex(object):
+    """Trigram index for typo tolerant lookup of short texts (titles and names).
+
+    Items sharing enough trigrams with the query match directly. Short texts
+    lose most of their trigrams by a single typo, so items sharing fewer
+    trigrams match when their edit distance to the query is small enough.
+
+    Index is built lazily on the first search by given loader and rebuilt once
+    it gets older than requested age, so that changes made by other processes
+    are eventually seen. Changes made by this process are applied immediately.
+
+    Args:
+      loader (callable): Function returning (Id, text) pairs of all indexed items.
+      threshold (float, optional): Minimal part of query trigrams contained in a match.
+      limit (int, optional): Maximal number of returned matches.
+    """
+
+    def __init__(self, loader, threshold=0.5, limit=1000):
+        self._loader = loader
+        self._threshold = threshold
+        self._limit = limit
+
+        self._lock = threading.Lock()
+        self._built = None
+        self._pending = None
+
+        # trigram -> set of item ids and item id -> its text, trigrams and folded words
+        self._postings = {}
+        self._items = {}
+
+    def _load(self):
+        postings = {}
+        items = {}
+        for item_id, text in self._loader():
+            items[item_id] = (text, trigrams(text), ' '.join(tokenize(text)))
+            for trigram in items[item_id][1]:
+                postings.setdefault(trigram, set()).add(item_id)
+
+        return postings, items
+
+    def _refresh(self, max_age):
+        with self._lock:
+            # the first build blocks all searches
+            if self._built is None:
+                self._postings, self._items = self._load()
+                self._built = time.time()
+                return
+
+            # rebuild is done by one search, others use the current index meanwhile
+            if time.time() - self._built <= max_age or self._pending is not None:
+                return
+            self._pending = []
+
+        try:
+            postings, items = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            self._postings, self._items = postings, items
+            self._built = time.time()
+
+            # replay changes made during the rebuild
+            pending, self._pending = self._pending, None
+            for item_id, text in pending:
+                self._apply(item_id, text)
+
+    def add(self, item_id, text):
+        """Add item into the index or update the indexed one (if the index is built)."""
+        with self._lock:
+            if self._built is not None:
+                self._apply(item_id, text)
+
+    def remove(self, item_id):
+        """Remove item from the index (if the index is built)."""
+        with self._lock:
+            if self._built is not None:
+                self._apply(item_id, None)
+
+    def _apply(self, item_id, text):
+        if self._pending is not None:
+            self._pending.append((item_id, text))
+
+        _, removed, _ = self._items.pop(item_id, (None, (), None))
+        for trigram in removed:
+            self._postings[trigram].discard(item_id)
+            if not self._postings[trigram]:
+                del self._postings[trigram]
+
+        if text is not None:
+            self._items[item_id] = (text, trigrams(text), ' '.join(tokenize(text)))
+            for trigram in self._items[item_id][1]:
+                self._postings.setdefault(trigram, set()).add(item_id)
+
+    def get_text(self, item_id):
+        """Get indexed text of given item."""
+        return self._items[item_id][0] if item_id in self._items else ''
+
+    def search(self, query, max_age):
+        """Find items similar to the query.
+
+        Args:
+          query (str): Query string.
+          max_age (int): Maximal age of the index in seconds.
+
+        Returns:
+          dict: Ids of matching items mapped to their similarity (from 0 to 1).
+        """
+        words = ' '.join(tokenize(query))
+        query = trigrams(query)
+        if not query:
+            return {}
+
+        self._refresh(max_age)
+
+        # every typo removes at most four trigrams of the text
+        typos = allowed_typos(words)
+        minimum = self._threshold * len(query)
+        candidate = min(minimum, max(len(query) - 4 * typos, 1))
+
+        with self._lock:
+            # count shared trigrams of all items sharing at least one trigram with the query
+            shared = Counter()
+            for trigram in query:
+                shared.update(self._postings.get(trigram, ()))
+
+            result = {}
+            for item_id, count in shared.items():
+                if count < candidate:
+                    continue
+
+                _, item_trigrams, item_words = self._items[item_id]
+                score = count / (len(query) + len(item_trigrams) - count)
+
+                # texts differing by the tolerated typos only are as similar as their lengths allow
+                distance = typo_distance(words, item_words, typos)
+                if distance <= typos:
+                    result[item_id] = max(score, 1 - distance / max(len(words), len(item_words)))
+                elif count >= minimum:
+                    result[item_id] = score
+
+        if len(result) > self._limit:
+            best = sorted(result, key=result.get, reverse=True)[:self._limit]
+            result = {item_id: result[item_id] for item_id in best}
+
+        return result
@@ -0,0 +1,120 @@
+from flask import g
+from flask import has_app_context
+
+
+class IdentityMap(object):
+    """Map of model objects loaded during one request.
+
+    Every object is loaded from the database at most once per request and
+    repeated lookups return the same instance. Objects are keyed by the name
+    of their collection and their Id. Map is thrown away at the end of the
+    request, saved and deleted objects are removed from it immediately.
+
+    Attributes:
+      hits (int): Number of lookups served from the map.
+      misses (int): Number of lookups which needed the database.
+    """
+
+    def __init__(self):
+        self._objects = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._objects)
+
+    def find_one(self, collection, query, factory):
+        """Find one object in the map or in the database.
+
+        Args:
+          collection: Reference to collection in database.
+          query (dict): Database query (only queries by '_id' can be served
+            from the map without the database).
+          factory (callable): Function creating model object from the document.
+
+        Returns:
+          One model object or None if it does not exist.
+        """
+        if list(query) == ['_id'] and (collection.name, query['_id']) in self._objects:
+            self.hits += 1
+            return self._objects[(collection.name, query['_id'])]
+
+        self.misses += 1
+        doc = collection.find_one(query)
+        if not doc:
+            return None
+
+        # object found by other fields could be already loaded as well
+        key = (collection.name, doc['_id'])
+        if key not in self._objects:
+            self._objects[key] = factory(doc)
+
+        return self._objects[key]
+
+    def discard(self, collection, object_id=None, predicate=None):
+        """Remove object from the map.
+
+        All objects of the collection (satisfying the predicate if it is given)
+        are removed if Id is not given.
+        """
+        if object_id is not None:
+            self._objects.pop((collection.name, object_id), None)
+            return
+
+        for key in [key for key in self._objects if key[0] == collection.name]:
+            if predicate is None or predicate(self._objects[key]):
+                del self._objects[key]
+
+
+def get_identity_map():
+    """Get identity map of the current request (None outside of the application context)."""
+    if not has_app_context():
+        return None
+
+    if 'identity_map' not in g:
+        g.identity_map = IdentityMap()
+
+    return g.identity_map
+
+
+def clear_identity_map():
+    """Throw away identity map of the current application context.
+
+    Map is cleared at the end of every request and at the start of every
+    unit of work done outside of requests (export job or prewarm batch),
+    so that it does not grow in long-lived application contexts.
+
+    Returns:
+      IdentityMap: Removed identity map or None if there was none.
+    """
+    if not has_app_context():
+        return None
+
+    return g.pop('identity_map', None)
+
+
+def find_one_mapped(collection, query, factory):
+    """Find one object through the identity map of the current request.
+
+    See `IdentityMap.find_one`, database is queried directly outside of the
+    application context.
+    """
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        return identity_map.find_one(collection, query, factory)
+
+    doc = collection.find_one(query)
+    if not doc:
+        return None
+
+    return factory(doc)
+
+
+def discard_mapped(collection, object_id=None, predicate=None):
+    """Remove object from the identity map of the current request (if there is one).
+
+    See `IdentityMap.discard`.
+    """
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.discard(collection, object_id, predicate)
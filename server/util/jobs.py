@@ -0,0 +1,146 @@
+import logging
+import threading
+
+from urllib.parse import urlsplit
+
+from flask import g
+from pymongo import MongoClient
+
+from server.app import app
+from server.model import Model
+from server.util.export import export_songbook
+from server.util.misc import log_event
+from server.util.workers import get_pool
+from server.util.identity import clear_identity_map
+from server.util.exceptions import AppException
+
+from server.constants import EVENTS
+from server.constants import EXCODES
+from server.constants import STRINGS
+
+logger = logging.getLogger(__name__)
+
+_resumed = False
+_resume_lock = threading.Lock()
+
+# model used inside of the export worker process
+_worker_model = None
+
+
+def _init_export_worker():
+    global _worker_model
+
+    # forked worker cannot share database connections with its parent
+    parsed = urlsplit(app.config['MONGODB_URI'])
+    mongo_client = MongoClient(app.config['MONGODB_URI'])
+    _worker_model = Model(db=mongo_client[parsed.path[1:]])
+
+
+def _run_export_job(job_id):
+    with app.app_context():
+        g.model = _worker_model
+
+        # objects loaded by previous jobs are not reused (see `clear_identity_map`)
+        clear_identity_map()
+
+        # job could be already claimed by other worker
+        job = g.model.jobs.claim(job_id, app.config['EXPORT_JOB_TIMEOUT'])
+        if job is None:
+            return
+
+        def _progress(value):
+            job.set_progress(value)
+            g.model.jobs.save(job)
+
+        def _heartbeat():
+            job.touch()
+            g.model.jobs.save(job)
+
+        try:
+            songbook = g.model.songbooks.find_one(songbook_id=job.get_songbook_id())
+            if songbook is None:
+                raise AppException(EVENTS.BASE_EXCEPTION, 404,
+                                   (EXCODES.DOES_NOT_EXIST, STRINGS.SONGBOOK_NOT_FOUND_ERROR))
+
+            result = export_songbook(songbook, progress=_progress, job_id=job.get_id(),
+                                     heartbeat=_heartbeat)
+            job.finish(result['link'], result['stats'])
+            log_event(EVENTS.EXPORT_DONE, job.get_owner(), job.get_id())
+        except AppException as exception:
+            job.fail(exception.get_exception())
+            log_event(EVENTS.EXPORT_FAILED, job.get_owner(), exception.get_exception())
+        except Exception:
+            logger.exception('Export job %s failed.', job_id)
+            job.fail([{
+                'code': EXCODES.COMPILATION_ERROR,
+                'message': STRINGS.COMPILATION_ERROR,
+                'data': None
+            }])
+            log_event(EVENTS.EXPORT_FAILED, job.get_owner(), job.get_id())
+
+        g.model.jobs.save(job)
+
+
+def _get_export_pool():
+    return get_pool('export', app.config['EXPORT_WORKERS'], initializer=_init_export_worker)
+
+
+def resume_export_jobs():
+    """Resubmit unfinished export jobs (e.g. after the application restart).
+
+    Jobs are resubmitted only once per application process. Jobs running
+    in other processes are left alone (they cannot be claimed again until
+    they time out).
+
+    Returns:
+      bool: True if unfinished jobs were resubmitted by this call.
+    """
+    global _resumed
+
+    with _resume_lock:
+        if _resumed:
+            return False
+        _resumed = True
+
+    pool = _get_export_pool()
+    for job in g.model.jobs.find_unfinished():
+        pool.apply_async(_run_export_job, (job.get_id(),))
+
+    return True
+
+
+def resume_stale_export_job(job):
+    """Resubmit export job, which was not updated for a long time.
+
+    Job could be left queued or running by a crashed process. It is
+    resubmitted by one check only once it times out (and again after
+    each following timeout), the job is claimed atomically, so at most
+    one worker runs it.
+
+    Args:
+      job (Job): Instance of the export job.
+
+    Returns:
+      bool: True if the job was resubmitted.
+    """
+    if not job.is_stale(app.config['EXPORT_JOB_TIMEOUT']):
+        return False
+
+    if not g.model.jobs.mark_resubmitted(job.get_id(), app.config['EXPORT_JOB_TIMEOUT']):
+        return False
+
+    _get_export_pool().apply_async(_run_export_job, (job.get_id(),))
+    return True
+
+
+def enqueue_export_job(job):
+    """Submit export job to the export worker pool.
+
+    Args:
+      job (Job): Instance of the export job.
+    """
+    # first submission in this process resubmits all unfinished jobs (including this one)
+    if resume_export_jobs():
+        return
+
+    _get_export_pool().apply_async(_run_export_job, (job.get_id(),))
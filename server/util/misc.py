@@ -1,12 +1,111 @@
+import os
+import time
 import uuid
+import fcntl
 import logging
 
+from contextlib import contextmanager
+
+from flask import json
+from flask import Response
+from flask import stream_with_context
+
 
 def generate_random_filename():
     temp = uuid.uuid4().urn
     return temp[9:]
 
 
+def ndjson_response(records):
+    """Create streamed response with one json record per line.
+
+    Args:
+      records (iterable): Records (json serializable) of the response.
+
+    Records are generated lazily while the response is being sent, request
+    context is kept for the whole time.
+    """
+    return Response(
+        stream_with_context(json.dumps(record) + '\n' for record in records),
+        mimetype='application/x-ndjson')
+
+
 def log_event(event, user, data):
     logger = logging.getLogger(__name__)
     logger.info('[{}] user: {}, data: {}'.format(event, user, data))
+
+
+@contextmanager
+def file_lock(path, on_wait=None, interval=10):
+    """Hold exclusive lock of given file (shared by all processes and threads).
+
+    Lock file is removed once the lock is released. Waiting holders notice
+    that their file was removed and lock the new one instead.
+
+    Args:
+      path (str): Path of the lock file.
+      on_wait (callable, optional): Function called periodically while waiting for the lock.
+      interval (int, optional): Number of seconds between the calls of `on_wait`.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        if on_wait is None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            _wait_for_lock(fd, on_wait, interval)
+
+        # lock is valid only if its file was not removed by the previous holder meanwhile
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+    try:
+        yield
+    finally:
+        os.remove(path)
+        os.close(fd)
+
+
+def _wait_for_lock(fd, on_wait, interval):
+    # lock is polled, so that the waiting holder can report that it is still alive
+    called = time.time()
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            pass
+
+        if time.time() - called >= interval:
+            on_wait()
+            called = time.time()
+        time.sleep(0.1)
+
+
+class StageTimer(object):
+    """Measure wall time of named stages of a longer operation.
+
+    Time of stages measured repeatedly under the same name is summed up.
+
+    Attributes:
+      timings (dict): Seconds spent in each stage.
+    """
+
+    def __init__(self):
+        self._start = time.time()
+        self.timings = {}
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + time.time() - start
+
+    def total(self):
+        """Get seconds elapsed since the timer was created."""
+        return time.time() - self._start
@@ -0,0 +1,183 @@
+import json
+import base64
+import pymongo
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from server.util.exceptions import AppException
+
+from server.constants import EVENTS
+from server.constants import EXCODES
+from server.constants import STRINGS
+
+
+def encode_cursor(doc, sort):
+    """Create opaque cursor pointing after given database document.
+
+    Args:
+      doc (dict): Last document of the current page.
+      sort (list): List of (field, direction) tuples used for sorting.
+
+    Returns:
+      str: Cursor token.
+    """
+    values = {}
+    for field, _ in sort:
+        values[field] = str(doc[field]) if field == '_id' else doc[field]
+
+    data = json.dumps(values, sort_keys=True, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode cursor token created by `encode_cursor`.
+
+    Args:
+      token (str): Cursor token.
+
+    Raises:
+      ValueError: If the token is not valid.
+
+    Returns:
+      dict: Sort values of the last document of the previous page.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data.decode('utf8'))
+        if not isinstance(values, dict) or '_id' not in values:
+            raise ValueError('Cursor does not contain document Id.')
+
+        # only plain values are allowed so that cursor cannot inject query operators
+        for value in values.values():
+            if not isinstance(value, (str, int, float)):
+                raise ValueError('Cursor contains invalid value.')
+
+        values['_id'] = ObjectId(values['_id'])
+    except (TypeError, UnicodeDecodeError, InvalidId) as e:
+        raise ValueError(str(e))
+
+    return values
+
+
+def _check_cursor(sort, after):
+    if set(field for field, _ in sort) != set(after):
+        raise AppException(EVENTS.REQUEST_EXCEPTION, 400,
+                           (EXCODES.WRONG_VALUE, STRINGS.REQUEST_CURSOR_ERROR, 'after'))
+
+
+def keyset_query(sort, after):
+    """Create query for documents following the cursor in given sort order.
+
+    Args:
+      sort (list): List of (field, direction) tuples used for sorting
+        (last one has to be the '_id' field).
+      after (dict): Decoded cursor (see `decode_cursor`).
+
+    Returns:
+      dict: Query for the database.
+    """
+    _check_cursor(sort, after)
+
+    # documents greater in the first field or equal in it and greater in the next ones
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev: after[prev] for prev, _ in sort[:i]}
+        clause[field] = {'$gt' if direction == pymongo.ASCENDING else '$lt': after[field]}
+        clauses.append(clause)
+
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def keyset_filter(docs, sort, after):
+    """Filter sorted documents following the cursor (see `keyset_query`).
+
+    Args:
+      docs (list): List of documents sorted in given sort order.
+      sort (list): List of (field, direction) tuples used for sorting.
+      after (dict): Decoded cursor (see `decode_cursor`).
+
+    Returns:
+      list: Documents following the cursor.
+    """
+    _check_cursor(sort, after)
+
+    def follows(doc):
+        for field, direction in sort:
+            if doc[field] != after[field]:
+                return (doc[field] > after[field]) == (direction == pymongo.ASCENDING)
+        return False
+
+    return [doc for doc in docs if follows(doc)]
+
+
+def page_in_memory(docs, sort, skip, limit, after=None):
+    """Sort and page documents in memory in the same way as the database does.
+
+    Args:
+      docs (list): List of documents containing all sort fields.
+      sort (list): List of (field, direction) tuples used for sorting.
+      skip (int): Number of skipped documents.
+      limit (int): Maximal number of returned documents.
+      after (dict, optional): Decoded cursor (see `decode_cursor`).
+
+    Returns:
+      tuple: Documents on the page and total number of documents (None if
+        the cursor is given).
+    """
+    # sort by every key starting from the least significant one (sorting is stable)
+    docs = list(docs)
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda doc: doc[field], reverse=direction == pymongo.DESCENDING)
+
+    if after is None:
+        count = len(docs)
+    else:
+        docs = keyset_filter(docs, sort, after)
+        count = None
+
+    return docs[skip:skip + limit], count
+
+
+def load_in_order(collection, entries):
+    """Load full documents of given entries from the collection (in the same order).
+
+    Fields of the entries (e.g. score) are added to the loaded documents.
+
+    Args:
+      collection: Reference to collection in database.
+      entries (list): List of partial documents containing at least '_id'.
+
+    Returns:
+      list: List of documents (entries missing in the collection are skipped).
+    """
+    docs = {}
+    for doc in collection.find({'_id': {'$in': [entry['_id'] for entry in entries]}}):
+        docs[doc['_id']] = doc
+
+    result = []
+    for entry in entries:
+        if entry['_id'] in docs:
+            docs[entry['_id']].update(entry)
+            result.append(docs[entry['_id']])
+
+    return result
+
+
+def split_page(docs, sort, per_page):
+    """Split documents fetched with one extra document into page and next cursor.
+
+    Args:
+      docs (list): List of at most `per_page + 1` documents.
+      sort (list): List of (field, direction) tuples used for sorting.
+      per_page (int): Number of documents per page.
+
+    Returns:
+      tuple: Documents on the page and cursor of the next page (None if there
+        is no next page).
+    """
+    if len(docs) <= per_page:
+        return docs, None
+
+    docs = docs[:per_page]
+    return docs, encode_cursor(docs[-1], sort)
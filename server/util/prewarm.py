@@ -0,0 +1,91 @@
+import time
+import logging
+
+from collections import deque
+from urllib.parse import urlsplit
+
+from flask import g
+from pymongo import MongoClient
+
+from server.app import app
+from server.model import Model
+from server.util.workers import get_pool
+from server.util.identity import clear_identity_map
+
+logger = logging.getLogger(__name__)
+
+# model used inside of the prewarm worker process
+_worker_model = None
+
+
+def _init_prewarm_worker():
+    global _worker_model
+
+    # forked worker cannot share database connections with its parent
+    parsed = urlsplit(app.config['MONGODB_URI'])
+    mongo_client = MongoClient(app.config['MONGODB_URI'])
+    _worker_model = Model(db=mongo_client[parsed.path[1:]])
+
+
+def _prewarm_batch(variants):
+    start = time.time()
+    with app.app_context():
+        g.model = _worker_model
+
+        # objects loaded by previous batches are not reused (see `clear_identity_map`)
+        clear_identity_map()
+        filled = g.model.variants.fill_export_caches(variants, strict=False)
+    elapsed = time.time() - start
+
+    # rest for a time proportional to the work done so that the database is not overloaded
+    time.sleep(elapsed * app.config['PREWARM_THROTTLE'])
+
+    return len(variants), filled
+
+
+def prewarm_export_caches(public_only=True):
+    """Fill empty export caches of variants in background worker processes.
+
+    Variants are found in batches, which are processed by the prewarm worker
+    pool. Only a few batches are queued at once so that the variants are not
+    read from the database faster than they are processed.
+
+    Args:
+      public_only (bool, optional): Whether to fill public variants only.
+
+    Returns:
+      tuple: Number of processed variants and number of filled export caches
+        (variants, which cannot be translated, are skipped).
+    """
+    workers = app.config['PREWARM_WORKERS']
+    pool = get_pool('prewarm', workers, initializer=_init_prewarm_worker)
+
+    total = g.model.variants.count_uncached(public_only)
+    logger.info('Prewarming export caches of %d variants.', total)
+
+    start = time.time()
+    processed, filled = 0, 0
+
+    def _collect(result):
+        nonlocal processed, filled
+
+        batch_processed, batch_filled = result.get()
+        processed += batch_processed
+        filled += batch_filled
+
+        logger.info('Prewarmed %d of %d variants (%.1f variants/s).', processed, total,
+                    processed / max(time.time() - start, 1e-6))
+
+    pending = deque()
+    for batch in g.model.variants.find_uncached(public_only, app.config['PREWARM_BATCH_SIZE']):
+        pending.append(pool.apply_async(_prewarm_batch, (batch,)))
+        if len(pending) >= 2 * workers:
+            _collect(pending.popleft())
+
+    while pending:
+        _collect(pending.popleft())
+
+    logger.info('Export caches of %d variants filled in %.1f s (%d variants skipped).', filled,
+                time.time() - start, processed - filled)
+
+    return processed, filled
@@ -0,0 +1,179 @@
+import re
+import bisect
+import threading
+import unicodedata
+
+from collections import Counter
+
+from server.constants import PERMISSION
+
+_WORD_REGEX = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+    """Convert text to lower case and remove diacritics (e.g. 'Zpívám' -> 'zpivam')."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """Split text into folded words."""
+    return _WORD_REGEX.findall(fold(text))
+
+
+class SearchIndex(object):
+    """In-memory inverted index of song variants for instant full-text search.
+
+    Variants are indexed by folded words of their search data (song title,
+    names of authors and interpreters and lyrics), the last word of the query
+    is matched as a prefix so that the index can be used while typing.
+    Sorted vocabulary is kept for the prefix lookups.
+
+    Index lives in the memory of one application process and it is updated
+    through the model hooks of that process only.
+
+    Attributes:
+      WEIGHTS (dict): Score of one word occurrence in given search field.
+    """
+
+    WEIGHTS = {'title': 10, 'names': 5, 'text': 1}
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+        # word -> {variant_id: score}
+        self._postings = {}
+        self._vocabulary = []
+
+        # variant_id -> [song_id, owner, visibility, {field: words}]
+        self._variants = {}
+        # song_id -> set of variant ids and song_id -> song title
+        self._songs = {}
+        self._titles = {}
+
+    def __len__(self):
+        return len(self._variants)
+
+    def add(self, variant_id, song_id, owner, visibility, search):
+        """Add variant into the index or update the indexed one.
+
+        Args:
+          variant_id (ObjectId): Variant Id.
+          song_id (ObjectId): Id of the variant song.
+          owner (str): Owner of the variant.
+          visibility (int): Visibility of the variant.
+          search (dict): Search data of the variant ('title', 'names' and 'text'),
+            data missing in the dict are kept from the previous update.
+        """
+        with self._lock:
+            fields = {}
+            if variant_id in self._variants:
+                fields = self._variants[variant_id][3]
+                self.remove(variant_id)
+
+            for field in self.WEIGHTS:
+                if field in search:
+                    fields[field] = tokenize(search[field] or '')
+
+            if 'title' in search:
+                self._titles[song_id] = search['title']
+
+            self._variants[variant_id] = [song_id, owner, visibility, fields]
+            self._songs.setdefault(song_id, set()).add(variant_id)
+
+            scores = Counter()
+            for field, words in fields.items():
+                for word in words:
+                    scores[word] += self.WEIGHTS[field]
+
+            for word, score in scores.items():
+                if word not in self._postings:
+                    self._postings[word] = {}
+                    bisect.insort(self._vocabulary, word)
+                self._postings[word][variant_id] = score
+
+    def remove(self, variant_id):
+        """Remove variant from the index (if it is indexed)."""
+        with self._lock:
+            if variant_id not in self._variants:
+                return
+
+            song_id, _, _, fields = self._variants.pop(variant_id)
+            for word in set(word for words in fields.values() for word in words):
+                postings = self._postings[word]
+                postings.pop(variant_id, None)
+                if not postings:
+                    del self._postings[word]
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+
+            self._songs[song_id].discard(variant_id)
+            if not self._songs[song_id]:
+                del self._songs[song_id]
+                self._titles.pop(song_id, None)
+
+    def update_song(self, song_id, search):
+        """Update search data shared by all variants of the song.
+
+        Args:
+          song_id (ObjectId): Song Id.
+          search (dict): Song search data ('title' and 'names').
+        """
+        with self._lock:
+            for variant_id in list(self._songs.get(song_id, ())):
+                _, owner, visibility, _ = self._variants[variant_id]
+                self.add(variant_id, song_id, owner, visibility, search)
+
+    def get_title(self, song_id):
+        return self._titles.get(song_id, '')
+
+    def _match_word(self, word, prefix=False):
+        if not prefix:
+            return self._postings.get(word, {})
+
+        # merge postings of all words starting with the prefix
+        result = {}
+        index = bisect.bisect_left(self._vocabulary, word)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(word):
+            for variant_id, score in self._postings[self._vocabulary[index]].items():
+                result[variant_id] = max(result.get(variant_id, 0), score)
+            index += 1
+
+        return result
+
+    def search(self, query, user_id):
+        """Find songs with at least one reachable variant containing all query words.
+
+        Args:
+          query (str): Query string (last word is matched as a prefix).
+          user_id (str): user Id string.
+
+        Returns:
+          dict: Song Ids mapped to the score of their best matching variant.
+        """
+        words = tokenize(query)
+        if not words:
+            return {}
+
+        with self._lock:
+            scores = None
+            for i, word in enumerate(words):
+                matches = self._match_word(word, prefix=(i == len(words) - 1))
+                if scores is None:
+                    scores = dict(matches)
+                else:
+                    scores = {
+                        variant_id: score + matches[variant_id]
+                        for variant_id, score in scores.items() if variant_id in matches
+                    }
+
+                if not scores:
+                    return {}
+
+            songs = {}
+            for variant_id, score in scores.items():
+                song_id, owner, visibility, _ = self._variants[variant_id]
+                if owner != user_id and visibility < PERMISSION.PUBLIC:
+                    continue
+                songs[song_id] = max(songs.get(song_id, 0), score)
+
+        return songs
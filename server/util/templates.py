@@ -47,6 +47,11 @@ class SongbookTemplate(object):
         self._page_numbering = options['page_numbering']
         self._song_numbering = options['song_numbering']
 
+        # songs compiled separately in chunks (see `set_chunks` and `set_chunk`)
+        self._chunks = None
+        self._first_page = 1
+        self._first_song = 1
+
     def inject_defaults(self, options):
         # Add missing options to given dict based on songbook defaults.
 
@@ -68,6 +73,14 @@ class SongbookTemplate(object):
     def set_filename(self, filename):
         self._filename = filename
 
+    def set_chunks(self, chunks):
+        self._chunks = chunks
+
+    def set_chunk(self, filename, first_page, first_song):
+        self._filename = filename
+        self._first_page = first_page
+        self._first_song = first_song
+
     def filename(self):
         # Filename of songbook sbd file (without the extension)
         return self._filename
@@ -99,3 +112,19 @@ class SongbookTemplate(object):
     def disable_song_numbering(self):
         # Boolean - whether songs should not have numbers
         return not self._song_numbering
+
+    def split(self):
+        # Boolean - whether songs are included from separately compiled chunks
+        return self._chunks is not None
+
+    def chunks(self):
+        # Filenames of separately compiled song chunks (without the extension)
+        return self._chunks or []
+
+    def first_page(self):
+        # Number of the first page of the song chunk
+        return self._first_page
+
+    def first_song(self):
+        # Number of the first song of the song chunk
+        return self._first_song
@@ -3,140 +3,195 @@ import re
 from server.constants import TAGS
 from server.constants import STRINGS
 
+# characters, which can be used in the song text
+_FORBIDDEN_REGEX = re.compile(r'[^\w\ \n.,:|?!+#"()[\]\'\-]', re.UNICODE)
 
-def translate_to_tex(song):
-    _log = []
-    _notes = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
-    _output = []
-    _regexp_allowed = r'[^\w\ \n.,:|?!+#"()[\]\'\-]'
-    _regexp_tags = '(\[\w+\]|\|:|:\|)([0-9]+)?'
-    _context = {
-        'rec': False,
-        'verse': False,
-        'chorus': False,
-        'repetition': False
-    } # yapf: disable
-
-    def _is_chord(chord):
-        if chord[1] in _notes:
-            return True
-        return False
-
-    def _finish_part():
+# song tags (with optional repetition count), characters, which must be escaped, and line ends
+_TOKEN_REGEX = re.compile(r'(\[\w+\]|\|:|:\|)([0-9]+)?|([\["%])|\n')
+
+_NOTES = frozenset(['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H'])
+_TAGS = frozenset(tag for tag in TAGS if isinstance(tag, str))
+_STARTING_TAGS = (TAGS.CHORUS, TAGS.VERSE, TAGS.INTRO, TAGS.REC, TAGS.SOLO)
+
+_ESCAPES = {
+    # escape chords so that they are interpered as special symbols
+    '[': '\\[',
+    # convert quotation marks to LaTeX compatible ones
+    '"': '\'\'',
+    # escape comment symbols
+    '%': '\\%'
+} # yapf: disable
+
+
+class _Translator(object):
+    """Translator of one song into the LaTeX format.
+
+    Song is translated in one scan over song tokens, translation log
+    is collected during the scan.
+    """
+
+    def __init__(self):
+        self._log = []
+        self._idx = 0
+
+        self._rec = False
+        self._verse = False
+        self._chorus = False
+        self._repetition = False
+
+    def _finish_part(self):
         # check for repetition overlapping to other blocks
-        if _context['repetition']:
-            _log.append(STRINGS.TRANSLATOR.ERROR_REPETITION_OVERLAPPING.format(_idx))
+        if self._repetition:
+            self._log.append(STRINGS.TRANSLATOR.ERROR_REPETITION_OVERLAPPING.format(self._idx))
 
         # finish and close previous block
-        if _context['rec']:
-            _context['rec'] = False
+        if self._rec:
+            self._rec = False
             return '}'
 
-        if _context['verse']:
-            _context['verse'] = False
+        if self._verse:
+            self._verse = False
             return '\\endverse'
 
-        elif _context['chorus']:
-            _context['chorus'] = False
+        elif self._chorus:
+            self._chorus = False
             return '\\endchorus'
 
         return ''
 
-    def _process_match(match):
-        _result = []
-
+    def _translate_token(self, match):
         tag = match.group(1)
-        info = match.group(2)
+
+        if tag is None:
+            # handle characters, which must be escaped
+            if match.group(3) is not None:
+                return _ESCAPES[match.group(3)]
+
+            # track line numbers for the translation log
+            self._idx += 1
+            return '\n'
 
         # handle tags and their correct translation
-        if tag.lower() in TAGS:
+        lower_tag = tag.lower()
+        if lower_tag in _TAGS:
 
-            # transform tag to lowercase
-            tag = tag.lower()
+            if lower_tag == TAGS.CHORUS:
+                result = self._finish_part() + '\\beginchorus\n'
+                self._chorus = True
 
-            if tag == TAGS.CHORUS:
-                _result.append(_finish_part())
-                _result.append('\\beginchorus\n')
+            elif lower_tag == TAGS.VERSE:
+                result = self._finish_part() + '\\beginverse\n'
+                self._verse = True
 
-                _context['chorus'] = True
+            elif lower_tag in TAGS._SPECIAL:
+                result = self._finish_part() + '\\beginverse*\n'
+                self._verse = True
 
-            elif tag == TAGS.VERSE:
-                _result.append(_finish_part())
-                _result.append('\\beginverse\n')
+            elif lower_tag == TAGS.REC:
+                result = self._finish_part() + '\\echo{'
+                self._rec = True
 
-                _context['verse'] = True
+            elif lower_tag == TAGS.REPETITION_START:
+                if self._repetition:
+                    self._log.append(STRINGS.TRANSLATOR.ERROR_NESTED_REPETITION.format(self._idx))
+                result = '\\lrep '
+                self._repetition = True
 
-            elif tag in TAGS._SPECIAL:
-                _result.append(_finish_part())
-                _result.append('\\beginverse*\n')
+            else:
+                if not self._repetition:
+                    self._log.append(
+                        STRINGS.TRANSLATOR.ERROR_REPETITION_END_BEFORE_START.format(self._idx))
 
-                _context['verse'] = True
+                count = match.group(2) if match.group(2) else 1
+                result = '\\rrep{{{}}}\n'.format(count)
+                self._repetition = False
 
-            elif tag == TAGS.REC:
-                _result.append(_finish_part())
-                _result.append('\\echo{')
+            return result
 
-                _context['rec'] = True
+        # handle chords
+        if tag[1] in _NOTES:
+            if self._rec:
+                self._log.append(STRINGS.TRANSLATOR.ERROR_CHORDS_INSIDE_REC.format(self._idx))
+            return '\\' + tag
 
-            elif tag == TAGS.REPETITION_START:
-                if _context['repetition']:
-                    _log.append(STRINGS.TRANSLATOR.ERROR_NESTED_REPETITION.format(_idx))
-                _result.append('\\lrep ')
+        self._log.append(STRINGS.TRANSLATOR.UNKNOWN_TAG.format(self._idx, match.group()))
+        return ''
 
-                _context['repetition'] = True
+    def translate(self, song):
+        # check that song contains only allowed characters
+        if _FORBIDDEN_REGEX.search(song):
+            self._log.append(STRINGS.TRANSLATOR.ERROR_STRING_CONTAINS_FORBIDDEN_CHARACTERS)
 
-            elif tag == TAGS.REPETITION_END:
-                if not _context['repetition']:
-                    _log.append(STRINGS.TRANSLATOR.ERROR_REPETITION_END_BEFORE_START.format(_idx))
+        # split song into individual lines (without surrounding whitespaces)
+        content = [x.strip() for x in song.strip().split('\n')]
 
-                count = info if info else 1
-                _result.append('\\rrep{{{}}}\n'.format(count))
+        # check for allowed tags at the beginning of the song
+        if not content[0].lower().startswith(_STARTING_TAGS):
+            self._log.append(STRINGS.TRANSLATOR.ERROR_NO_STARTING_BLOCK)
 
-                _context['repetition'] = False
+        output = _TOKEN_REGEX.sub(self._translate_token, '\n'.join(content))
 
-        # handle chords
-        elif _is_chord(tag):
-            if _context['rec']:
-                _log.append(STRINGS.TRANSLATOR.ERROR_CHORDS_INSIDE_REC.format(_idx))
-            _result.append(tag)
+        # finish entire song
+        output = '\n'.join([output, self._finish_part()])
+
+        return output, '\n'.join(self._log)
+
+
+def _translate_log(item):
+    index, song = item
+    _, log = translate_to_tex(song)
+    return {'index': index, 'log': log}
 
-        else:
-            _log.append(STRINGS.TRANSLATOR.UNKNOWN_TAG.format(_idx, match.group()))
 
-        return ''.join(_result)
+def translate_many(songs, pool=None, batch_size=1):
+    """Translate multiple songs and yield their translation logs.
 
-    # check that song contains only
-    reg = re.compile(_regexp_allowed, re.UNICODE)
-    if bool(reg.search(song)):
-        _log.append(STRINGS.TRANSLATOR.ERROR_STRING_CONTAINS_FORBIDDEN_CHARACTERS)
+    Args:
+      songs (list): List of song texts.
+      pool (multiprocessing.pool.Pool, optional): Worker pool used for the translation.
+      batch_size (int, optional): Number of songs sent to one worker at once.
 
-    # remove whitespaces from beginning and end of the song
-    song = song.strip()
+    If the pool is given, logs are yielded as soon as they are finished
+    (not necessarily in the order of given songs).
 
-    # split song into individual lines
-    content = [x.strip() for x in song.split('\n')]
+    Yields:
+      dict: Song index and its translation log.
+    """
+    if pool is None:
+        for item in enumerate(songs):
+            yield _translate_log(item)
+    else:
+        yield from pool.imap_unordered(_translate_log, enumerate(songs), chunksize=batch_size)
 
-    # check for allowed tags at the beginning of the song
-    first_line = content[0].lower()
-    if not (first_line.startswith("[chorus]") or first_line.startswith("[verse]") or
-            first_line.startswith("[intro]") or first_line.startswith("[rec]") or
-            first_line.startswith("[solo]")):
-        _log.append(STRINGS.TRANSLATOR.ERROR_NO_STARTING_BLOCK)
 
-    for _idx, line in enumerate(content):
-        # translate each tag into LaTeX format
-        line = re.sub(_regexp_tags, _process_match, line)
+def _strip_token(match):
+    tag = match.group(1)
+    if tag is None:
+        return match.group()
 
-        # escape chords so that they are interpered as special symbols
-        line = line.replace('[', '\\[')
-        # convert quotation marks to LaTeX compatible ones
-        line = line.replace('"', '\'\'')
-        # escape comment symbols
-        line = line.replace('%', '\\%')
+    # chords can be placed inside of words, so they are removed completely
+    return ' ' if tag.lower() in _TAGS else ''
 
-        _output.append(line)
 
-    # finish entire song
-    _output.append(_finish_part())
+def strip_tags(song):
+    """Remove tags and chords from the song text (e.g. for full-text search).
+
+    Args:
+      song (str): Song text (lyrics and chords).
+
+    Returns:
+      str: Song lyrics only.
+    """
+    return _TOKEN_REGEX.sub(_strip_token, song)
+
+
+def translate_to_tex(song):
+    """Translate song from the song format into the LaTeX format.
+
+    Args:
+      song (str): Song text (lyrics and chords).
 
-    return '\n'.join(_output), '\n'.join(_log)
+    Returns:
+      tuple: Translated song and translation log (empty if there is no problem).
+    """
+    return _Translator().translate(song)
@@ -1,6 +1,8 @@
 from flask import g
+from bson.errors import InvalidId
 
 from server.util.exceptions import AppException
+from server.util.pagination import decode_cursor
 from server.util.translator import translate_to_tex
 
 from server.constants import EVENTS
@@ -17,7 +19,9 @@ def handle_GET_request(request):
         'query': request['query'] if 'query' in request and request['query'] is not None else "",
         'page': 0,
         'per_page': 30,
-        'order': None
+        'order': None,
+        'after': None,
+        'fuzzy': False
     }
 
     if 'page' in request and request['page'] is not None:
@@ -39,6 +43,16 @@ def handle_GET_request(request):
                                (EXCODES.WRONG_VALUE, STRINGS.REQUEST_PAGE_OOR_ERROR, 'order'))
         data['order'] = request['order']
 
+    if 'fuzzy' in request and request['fuzzy'] is not None:
+        data['fuzzy'] = request['fuzzy'] in ('1', 'true')
+
+    if 'after' in request and request['after'] is not None:
+        try:
+            data['after'] = decode_cursor(request['after'])
+        except ValueError:
+            raise AppException(EVENTS.REQUEST_EXCEPTION, 400,
+                               (EXCODES.WRONG_VALUE, STRINGS.REQUEST_CURSOR_ERROR, 'after'))
+
     return data
 
 
@@ -89,6 +103,19 @@ def songbook_existence(songbook_id):
     return songbook
 
 
+def job_existence(job_id):
+    try:
+        job = g.model.jobs.find_one(job_id=job_id)
+    except (ValueError, InvalidId):
+        raise AppException(EVENTS.REQUEST_EXCEPTION, 404,
+                           (EXCODES.DOES_NOT_EXIST, STRINGS.EXPORT_NOT_FOUND_ERROR))
+
+    if job is None:
+        raise AppException(EVENTS.BASE_EXCEPTION, 404,
+                           (EXCODES.DOES_NOT_EXIST, STRINGS.EXPORT_NOT_FOUND_ERROR))
+    return job
+
+
 def author_existence(author_id):
     try:
         author = g.model.authors.find_one(author_id=author_id)
@@ -233,6 +260,19 @@ def song_variant_request(request):
     return data
 
 
+def variants_validate_request(request):
+    if 'texts' not in request or not isinstance(request['texts'], list) or \
+            not all(isinstance(text, str) for text in request['texts']):
+        raise AppException(EVENTS.REQUEST_EXCEPTION, 422,
+                           (EXCODES.MISSING_FIELD, STRINGS.REQUEST_VARIANT_TEXTS_MISSING, 'texts'))
+
+    if len(request['texts']) > 5000:
+        raise AppException(EVENTS.REQUEST_EXCEPTION, 422,
+                           (EXCODES.WRONG_VALUE, STRINGS.REQUEST_VARIANT_TEXTS_OOR_ERROR, 'texts'))
+
+    return {'texts': request['texts']}
+
+
 def songbooks_request(request):
     ex = AppException(EVENTS.REQUEST_EXCEPTION, 422)
 
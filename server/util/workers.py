@@ -0,0 +1,25 @@
+import threading
+import multiprocessing
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, processes, initializer=None):
+    """Get worker process pool with given name (create it on the first use).
+
+    Pools are created lazily so that worker processes are not forked before
+    the application server forks its own workers.
+
+    Args:
+      name (str): Name of the pool.
+      processes (int): Number of worker processes.
+      initializer (callable, optional): Function called in every new worker.
+
+    Returns:
+      multiprocessing.pool.Pool: Pool of worker processes.
+    """
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = multiprocessing.Pool(processes=processes, initializer=initializer)
+        return _pools[name]
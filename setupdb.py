@@ -7,6 +7,7 @@ import pymongo
 from urllib.parse import urlsplit
 
 from server.config import MONGODB_URI
+from server.config import EXPORT_STATS_COUNT
 
 
 def setup_database():
@@ -25,13 +26,44 @@ def setup_database():
     # remove all indexes
     db['songbooks'].drop_indexes()
     db['songs'].drop_indexes()
+    db['variants'].drop_indexes()
+    db['authors'].drop_indexes()
+    db['interpreters'].drop_indexes()
 
     # prepare songbooks database indexes
     db['songbooks'].create_index([("title", pymongo.TEXT)], name="SongbookIndex")
+    db['songbooks'].create_index(
+        [("owner", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name="SongbookOwnerIndex")
+    db['songbooks'].create_index([("summary.variant_id", pymongo.ASCENDING)],
+                                 name="SongbookSummaryVariantIndex")
+    db['songbooks'].create_index([("summary.song.song_id", pymongo.ASCENDING)],
+                                 name="SongbookSummarySongIndex")
 
     # prepare songs database indexes
     db['songs'].create_index(
-        [("title", pymongo.TEXT), ("text", pymongo.TEXT)], name="SongIndex", weights={"title": 3})
+        [("title", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name="SongTitleIndex")
+
+    # prepare variants database indexes (used for song lookups and permission filtering)
+    db['variants'].create_index([("song_id", pymongo.ASCENDING)], name="VariantSongIndex")
+    db['variants'].create_index(
+        [("owner", pymongo.ASCENDING), ("song_id", pymongo.ASCENDING)], name="VariantOwnerIndex")
+
+    # prepare full-text search index (songs are searched through their variants)
+    db['variants'].create_index(
+        [("search.title", pymongo.TEXT), ("search.names", pymongo.TEXT),
+         ("search.text", pymongo.TEXT)],
+        name="VariantSearchIndex",
+        weights={"search.title": 10, "search.names": 5, "search.text": 1},
+        default_language="none")
+
+    # prepare authors and interpreters database indexes
+    db['authors'].create_index([("name", pymongo.TEXT)], name="AuthorIndex")
+    db['interpreters'].create_index([("name", pymongo.TEXT)], name="InterpreterIndex")
+
+    # prepare capped collection for export statistics (it keeps only the latest exports)
+    if 'export_stats' not in db.collection_names():
+        db.create_collection(
+            'export_stats', capped=True, size=EXPORT_STATS_COUNT * 1024, max=EXPORT_STATS_COUNT)
 
     print('Done!')
 
@@ -7,3 +7,4 @@ from tests.exports import ExportTest
 from tests.variants import SongVariantTest
 from tests.songbooks import SongbookTest
 from tests.translator import TranslatorTest
+from tests.search import SearchIndexTest
@@ -6,6 +6,7 @@ from urllib.parse import urlsplit
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
 
 
 class AuthorTest(unittest.TestCase):
@@ -20,11 +21,13 @@ class AuthorTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_author_basics(self):
         # check empty database get request
@@ -113,6 +116,37 @@ class AuthorTest(unittest.TestCase):
         # clean the database
         self.mongo_client.drop_database(self.db_name)
 
+    def test_author_paging(self):
+        for name in ['Jimmy Page', 'Robert Plant', 'John Bonham']:
+            rv = utils._post_author(self.app, name=name)
+            assert rv.status_code == 201
+
+        # all authors are returned as a list without paging parameters
+        rv = self.app.get('/api/v1/authors')
+        assert rv.status_code == 200
+        assert len(json.loads(rv.data)) == 3
+
+        # follow cursors through paged result
+        rv = self.app.get('/api/v1/authors?per_page=2')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert len(res['data']) == 2 and res['next_cursor'] is not None
+
+        rv = self.app.get('/api/v1/authors?per_page=2&after={}'.format(res['next_cursor']))
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert len(res['data']) == 1 and res['next_cursor'] is None
+        assert res['data'][0]['name'] == 'John Bonham'
+
+        # names with typos are found with fuzzy search
+        rv = self.app.get('/api/v1/authors?query=Robrt%20Plamt&fuzzy=1')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert [x['name'] for x in res['data']] == ['Robert Plant']
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
     def test_put_request(self):
         # insert test author for further testing
         rv = utils._post_author(self.app, name='Jack Black')
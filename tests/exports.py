@@ -1,12 +1,21 @@
 import os
 import json
+import time
+import shutil
+import tempfile
+import datetime
 import unittest
+import threading
 import tests.utils as utils
 
 from urllib.parse import urlsplit
+from bson import ObjectId
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
+from server.util.export import CompilerOutput
+from server.util.export import get_content_hash
 
 
 class ExportTest(unittest.TestCase):
@@ -21,11 +30,13 @@ class ExportTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_songbook_export(self):
         # insert test songbook for further testing
@@ -87,6 +98,7 @@ class ExportTest(unittest.TestCase):
         # check correct json structure
         data = json.loads(rv.data)
         assert 'link' in data
+        assert data['passes'] == ['xelatex', 'songidx', 'xelatex']
 
         # delete generated file
         link = json.loads(rv.data)['link']
@@ -111,7 +123,8 @@ class ExportTest(unittest.TestCase):
         assert rv.status_code == 200
         assert b'download/' in rv.data
 
-        first_link = json.loads(rv.data)['link']
+        first = json.loads(rv.data)
+        first_link = first['link']
 
         # test export cache
         rv = self.app.get(
@@ -121,6 +134,73 @@ class ExportTest(unittest.TestCase):
         assert rv.status_code == 200
         assert b'download/' in rv.data
 
+        # cached export returns the same fields without any compilation passes
+        second = json.loads(rv.data)
+        second_link = second['link']
+        assert first_link == second_link
+        assert set(first) == set(second) == {'link', 'log', 'passes', 'stats'}
+        assert first['passes'] and second['passes'] == []
+
+        # delete generated file
+        filename = str(first_link).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_export_without_index(self):
+        # insert test songbook without index
+        rv = utils._post_songbook(self.app, title="Songbook without index")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        rv = utils._put_songbook_options(self.app, songbook_id, options={'index': False})
+        assert rv.status_code == 200
+
+        # export test songbook as pdf
+        rv = self.app.get(
+            '/api/v1/songbooks/{}'.format(songbook_id), headers={
+                'Accept': 'application/pdf'
+            })
+        assert rv.status_code == 200
+
+        # only one compilation pass is needed
+        data = json.loads(rv.data)
+        assert data['passes'] == ['xelatex']
+
+        # delete generated file
+        filename = str(data['link']).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_export_content_cache(self):
+        # insert test songbook for further testing
+        rv = utils._post_songbook(self.app, title="Original songbook")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        # export test songbook as pdf
+        rv = self.app.get(
+            '/api/v1/songbooks/{}'.format(songbook_id), headers={
+                'Accept': 'application/pdf'
+            })
+        assert rv.status_code == 200
+        first_link = json.loads(rv.data)['link']
+
+        # duplicate the songbook and export the duplicate
+        rv = self.app.get('/api/v1/songbooks/{}/duplicate'.format(songbook_id))
+        assert rv.status_code == 201
+        duplicate_id = json.loads(rv.data)['link'].split('/')[1]
+
+        rv = self.app.get(
+            '/api/v1/songbooks/{}'.format(duplicate_id), headers={
+                'Accept': 'application/pdf'
+            })
+        assert rv.status_code == 200
+
+        # songbooks with the same content share the exported file
         second_link = json.loads(rv.data)['link']
         assert first_link == second_link
 
@@ -130,3 +210,372 @@ class ExportTest(unittest.TestCase):
 
         # clean the database
         self.mongo_client.drop_database(self.db_name)
+
+    def test_content_hash(self):
+        folder = app.config['SONGBOOK_TEMPLATE_FOLDER']
+        with tempfile.TemporaryDirectory() as temp:
+            # copy templates and songs package to the temporary folder
+            templates = os.path.join(temp, 'templates') + '/'
+            shutil.copytree(folder, templates)
+            shutil.copy(os.path.join(folder, os.pardir, 'songs.sty'), temp)
+
+            def _modify(path):
+                with open(path, 'a') as file:
+                    file.write('%')
+                stat = os.stat(path)
+                os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+            app.config['SONGBOOK_TEMPLATE_FOLDER'] = templates
+            try:
+                # fragment boundaries and options are part of the hash
+                first = get_content_hash({'index': True}, ['Song', 'Other'])
+                assert get_content_hash({'index': True}, ['Song', 'Other']) == first
+                assert get_content_hash({'index': True}, ['SongOther']) != first
+                assert get_content_hash({'index': False}, ['Song', 'Other']) != first
+
+                # changed templates and songs package change the hash as well
+                _modify(templates + 'song_template.mustache')
+                second = get_content_hash({'index': True}, ['Song', 'Other'])
+                assert second != first
+
+                _modify(os.path.join(temp, 'songs.sty'))
+                assert get_content_hash({'index': True}, ['Song', 'Other']) not in (first, second)
+            finally:
+                app.config['SONGBOOK_TEMPLATE_FOLDER'] = folder
+
+    def test_songbook_export_format(self):
+        rv = utils._post_songbook(self.app, title="Formatted songbook")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        rv = utils._put_songbook_options(self.app, songbook_id, options={'index': False})
+        assert rv.status_code == 200
+
+        # export test songbook as pdf (formats are disabled by default)
+        precompiled = app.config['EXPORT_PRECOMPILED_FORMAT']
+        app.config['EXPORT_PRECOMPILED_FORMAT'] = True
+        try:
+            rv = self.app.get(
+                '/api/v1/songbooks/{}'.format(songbook_id), headers={
+                    'Accept': 'application/pdf'
+                })
+        finally:
+            app.config['EXPORT_PRECOMPILED_FORMAT'] = precompiled
+        assert rv.status_code == 200
+
+        # songbook preamble is precompiled into the format for next exports
+        formats = os.listdir(app.config['SONGBOOK_FORMAT_FOLDER'])
+        assert any(fname.startswith('songbook-') and fname.endswith('.fmt') for fname in formats)
+
+        # files of the format build are removed
+        assert all(fname.endswith('.fmt') for fname in formats)
+
+        # delete generated file
+        filename = str(json.loads(rv.data)['link']).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_export_split(self):
+        rv = utils._post_songbook(self.app, title="Split songbook")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        songs = []
+        for title in ('Numb', 'Given Up', 'Faint'):
+            rv = utils._post_song(self.app, title=title, text='[verse][Em]Text of ' + title)
+            assert rv.status_code == 201
+            songs.append({'variant_id': json.loads(rv.data)['variants'][0]['id']})
+
+        rv = utils._put_songbook_songs(self.app, songbook_id, songs=songs)
+        assert rv.status_code == 200
+
+        # compile songbook in chunks of songs
+        split_songs, split_workers = app.config['EXPORT_SPLIT_SONGS'], app.config[
+            'EXPORT_SPLIT_WORKERS']
+        app.config['EXPORT_SPLIT_SONGS'], app.config['EXPORT_SPLIT_WORKERS'] = 2, 2
+        try:
+            rv = self.app.get(
+                '/api/v1/songbooks/{}'.format(songbook_id), headers={
+                    'Accept': 'application/pdf'
+                })
+            assert rv.status_code == 200
+            data = json.loads(rv.data)
+
+            # songbook with the same content reuses the exported file without compilation
+            rv = self.app.get('/api/v1/songbooks/{}/duplicate'.format(songbook_id))
+            assert rv.status_code == 201
+            duplicate_id = json.loads(rv.data)['link'].split('/')[1]
+
+            rv = self.app.get(
+                '/api/v1/songbooks/{}'.format(duplicate_id), headers={
+                    'Accept': 'application/pdf'
+                })
+            assert rv.status_code == 200
+            duplicate = json.loads(rv.data)
+        finally:
+            app.config['EXPORT_SPLIT_SONGS'] = split_songs
+            app.config['EXPORT_SPLIT_WORKERS'] = split_workers
+
+        # chunks and frame are measured by drafts first, then every chunk is compiled once
+        # at its final page and the merged index is compiled into the frame
+        assert data['passes'] == [
+            'xelatex-measure', 'xelatex-measure', 'xelatex-chunks', 'songidx', 'xelatex'
+        ]
+        assert data['stats']['split']
+
+        # only compiled songbooks are recorded as split
+        assert duplicate['link'] == data['link']
+        assert duplicate['passes'] == [] and not duplicate['stats']['split']
+
+        # delete generated file
+        filename = str(data['link']).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_export_job(self):
+        # insert test songbook for further testing
+        rv = utils._post_songbook(self.app, title="Job songbook")
+        assert rv.status_code == 201
+        songbook = json.loads(rv.data)
+        songbook_id = songbook['id']
+
+        # create export job
+        rv = self.app.post('/api/v1/songbooks/{}/exports'.format(songbook_id))
+        assert rv.status_code == 202
+        job = json.loads(rv.data)
+        assert job['songbook_id'] == songbook_id
+        assert job['status'] in ['queued', 'running', 'done']
+
+        # poll job status until it is finished
+        for _ in range(120):
+            rv = self.app.get('/api/v1/exports/{}'.format(job['id']))
+            assert rv.status_code == 200
+            job = json.loads(rv.data)
+            if job['status'] in ['done', 'failed']:
+                break
+            time.sleep(0.5)
+
+        assert job['status'] == 'done'
+        assert job['progress'] == 100
+        assert 'download/' in job['link']
+
+        # check non existing job
+        rv = self.app.get('/api/v1/exports/000000000000000000000000')
+        assert rv.status_code == 404
+
+        # delete generated file
+        filename = str(job['link']).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_export_stats(self):
+        # insert test songbook for further testing
+        rv = utils._post_songbook(self.app, title="Stats songbook")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        # capped collection is created by the setupdb script
+        with app.app_context():
+            model.export_stats.create_collection()
+
+        # export test songbook twice (the second export is served from cache)
+        for _ in range(2):
+            rv = self.app.get(
+                '/api/v1/songbooks/{}'.format(songbook_id), headers={
+                    'Accept': 'application/pdf'
+                })
+            assert rv.status_code == 200
+
+        link = json.loads(rv.data)['link']
+        stats = json.loads(rv.data)['stats']
+        assert stats['songbook_id'] == songbook_id
+        assert stats['cached']
+        assert stats['size'] > 0
+
+        # stats are stored in capped collection
+        options = self.mongo_db['export_stats'].options()
+        assert options['capped']
+        assert self.mongo_db['export_stats'].count() == 2
+
+        # statistics are available to editors only
+        rv = self.app.get('/api/v1/exports/stats')
+        assert rv.status_code == 403
+
+        self.mongo_db['users'].update_one({'_id': 0}, {'$set': {'editor': True}})
+        config = {'USER_CACHE_TTL': 0, 'EXPORT_STATS_TTL': 0}
+        original = {key: app.config[key] for key in config}
+        app.config.update(config)
+        try:
+            rv = self.app.get('/api/v1/exports/stats')
+        finally:
+            app.config.update(original)
+        assert rv.status_code == 200
+        summary = json.loads(rv.data)
+        assert summary['count'] == 2
+        assert summary['cache_hits']['songbook'] == 0.5
+        assert summary['stages']['xelatex_1']['count'] == 1
+        assert summary['total']['p50'] <= summary['total']['p95']
+
+        # delete generated file
+        filename = str(link).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_export_single_flight(self):
+        # insert test songbook for further testing
+        rv = utils._post_songbook(self.app, title="Single flight songbook")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        results = []
+
+        def _export():
+            client = app.test_client()
+            client.get('/test_login')
+            rv = client.get(
+                '/api/v1/songbooks/{}'.format(songbook_id), headers={
+                    'Accept': 'application/pdf'
+                })
+            results.append(json.loads(rv.data))
+
+        # export the same songbook concurrently
+        threads = [threading.Thread(target=_export) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # songbook was compiled only once and all exports share its file
+        assert len(results) == 3
+        assert len({result['link'] for result in results}) == 1
+        assert len([result for result in results if result.get('passes')]) == 1
+
+        # lock file was removed
+        assert not [
+            fname for fname in os.listdir('./songs/temp') if fname.startswith('export-')
+        ]
+
+        # delete generated file
+        filename = str(results[0]['link']).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_compiler_output(self):
+        songs = []
+        output = CompilerOutput(on_song=songs.append)
+
+        # songs and page markers are parsed as they arrive
+        assert not output.feed(b'This is XeTeX\n')
+        assert not output.feed(b'ZPEVNIK-SONG\n')
+        assert not output.feed(b'ZPEVNIK-SONG\n')
+        assert not output.feed(b'ZPEVNIK-NEXT-PAGE=12\n')
+        assert songs == [1, 2]
+        assert output.songs == 2
+        assert output.next_page == 12
+
+        # fatal error is complete once its line number is read
+        assert not output.feed(b'! Undefined control sequence.\n')
+        assert not output.feed(b'<argument> \\foo\n')
+        assert output.feed(b'l.42 \\beginsong{Numb}\n')
+        assert output.errors[0] == '! Undefined control sequence.'
+        assert output.get_log().endswith('l.42 \\beginsong{Numb}')
+
+    def test_songbook_export_stale_job(self):
+        # insert test songbook for further testing
+        rv = utils._post_songbook(self.app, title="Stale job songbook")
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        # first export job resumes unfinished jobs of this process
+        rv = self.app.post('/api/v1/songbooks/{}/exports'.format(songbook_id))
+        assert rv.status_code == 202
+        job = json.loads(rv.data)
+
+        def _wait_for_job(job_id):
+            for _ in range(120):
+                rv = self.app.get('/api/v1/exports/{}'.format(job_id))
+                assert rv.status_code == 200
+                job = json.loads(rv.data)
+                if job['status'] in ['done', 'failed']:
+                    return job
+                time.sleep(0.5)
+
+            return job
+
+        job = _wait_for_job(job['id'])
+        assert job['status'] == 'done'
+
+        # simulate job left running by a crashed worker
+        updated = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=app.config['EXPORT_JOB_TIMEOUT'] + 1)
+        self.mongo_db['jobs'].update_one({
+            '_id': ObjectId(job['id'])
+        }, {'$set': {
+            'status': 'running',
+            'progress': 30,
+            'link': None,
+            'updated': updated
+        }})
+
+        # stale job is picked up again by polling its status
+        job = _wait_for_job(job['id'])
+        assert job['status'] == 'done'
+        assert 'download/' in job['link']
+
+        # delete generated file
+        filename = str(job['link']).split('/')[1]
+        os.remove(os.path.join('./songs/done', filename))
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_export_job_resubmission(self):
+        timeout = app.config['EXPORT_JOB_TIMEOUT']
+        stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=timeout + 1)
+
+        # insert job left running by a crashed worker
+        job_id = ObjectId()
+        self.mongo_db['jobs'].insert_one({
+            '_id': job_id,
+            'songbook_id': str(ObjectId()),
+            'owner': 'owner',
+            'status': 'running',
+            'progress': 30,
+            'link': None,
+            'log': None,
+            'stats': None,
+            'updated': stale
+        })
+
+        # stale job is resubmitted only once per timeout
+        assert model.jobs.mark_resubmitted(str(job_id), timeout)
+        assert not model.jobs.mark_resubmitted(str(job_id), timeout)
+
+        self.mongo_db['jobs'].update_one({'_id': job_id}, {'$set': {'resubmitted': stale}})
+        assert model.jobs.mark_resubmitted(str(job_id), timeout)
+
+        # finished jobs are never resubmitted
+        self.mongo_db['jobs'].update_one({
+            '_id': job_id
+        }, {'$set': {
+            'status': 'done',
+            'resubmitted': stale
+        }})
+        assert not model.jobs.mark_resubmitted(str(job_id), timeout)
+
+        # malformed job ids are reported as missing jobs
+        rv = self.app.get('/api/v1/exports/invalid')
+        assert rv.status_code == 404
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
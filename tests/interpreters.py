@@ -6,6 +6,7 @@ from urllib.parse import urlsplit
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
 
 
 class InterpreterTest(unittest.TestCase):
@@ -20,11 +21,13 @@ class InterpreterTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_interpreter_basics(self):
         # check empty database get request
@@ -1,11 +1,15 @@
 import json
 import unittest
+import tests.utils as utils
 
+from unittest import mock
 from urllib.parse import urlsplit
 from bson import ObjectId
+from pymongo import TEXT
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
 from server.constants import PERMISSION
 
 
@@ -21,11 +25,13 @@ class QueryTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def _insert_song(self, owner, visibility, approved=False):
         # insert new song directly into database
@@ -94,3 +100,201 @@ class QueryTest(unittest.TestCase):
 
         # clean the database
         self.mongo_client.drop_database(self.db_name)
+
+    def test_query_paging(self):
+        # insert visible and hidden test songs into the database
+        validIds = []
+        for _ in range(5):
+            validIds.append(self._insert_song(0, PERMISSION.PRIVATE))
+        self._insert_song(1, PERMISSION.PRIVATE)
+
+        # go through all pages and collect returned songs
+        Ids = []
+        for page in range(3):
+            rv = self.app.get('/api/v1/songs?per_page=2&page={}'.format(page))
+            res = json.loads(rv.data)
+
+            assert rv.status_code == 200
+            assert int(res['count']) == len(validIds)
+            assert int(res['pages']) == 3
+            assert len(res['data']) == (2 if page < 2 else 1)
+
+            Ids.extend([ObjectId(x['id']) for x in res['data']])
+
+        # check that every song was returned exactly once
+        assert sorted(Ids) == sorted(validIds)
+
+        # check page out of range
+        rv = self.app.get('/api/v1/songs?per_page=2&page=3')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert int(res['count']) == len(validIds)
+        assert len(res['data']) == 0
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_query_cursor_paging(self):
+        # insert visible and hidden test songs into the database
+        validIds = []
+        for _ in range(5):
+            validIds.append(self._insert_song(0, PERMISSION.PRIVATE))
+            self._insert_song(1, PERMISSION.PRIVATE)
+
+        # first page is requested without cursor
+        rv = self.app.get('/api/v1/songs?per_page=2&order=title')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert int(res['count']) == len(validIds)
+
+        # follow cursors until the last page
+        Ids = [ObjectId(x['id']) for x in res['data']]
+        while res['next_cursor'] is not None:
+            rv = self.app.get('/api/v1/songs?per_page=2&order=title&after={}'.format(
+                res['next_cursor']))
+            res = json.loads(rv.data)
+
+            assert rv.status_code == 200
+            assert 'count' not in res
+            Ids.extend([ObjectId(x['id']) for x in res['data']])
+
+        # check that every song was returned exactly once and in the correct order
+        assert Ids == sorted(validIds)
+
+        # check invalid cursors
+        rv = self.app.get('/api/v1/songs?after=invalid')
+        assert rv.status_code == 400
+
+        rv = self.app.get('/api/v1/songs?per_page=2')
+        res = json.loads(rv.data)
+        rv = self.app.get('/api/v1/songs?order=title&after={}'.format(res['next_cursor']))
+        assert rv.status_code == 400
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_query_lyrics_search(self):
+        # full-text search index is created by the setupdb script
+        self.mongo_db['variants'].create_index(
+            [("search.title", TEXT), ("search.names", TEXT), ("search.text", TEXT)],
+            weights={"search.title": 10, "search.names": 5, "search.text": 1},
+            default_language="none")
+
+        rv = utils._post_author(self.app, name='Paul McCartney')
+        author_id = json.loads(rv.data)['link'].split('/')[1]
+
+        rv = utils._post_song(
+            self.app,
+            title='Yesterday',
+            text='[verse]\nAll my [C]trou[G]bles seemed so far away',
+            mauthors=[author_id])
+        assert rv.status_code == 201
+        song_id = json.loads(rv.data)['id']
+
+        rv = utils._post_song(
+            self.app, title='Kashmir', text='[verse]\nOh let the sun beat down upon my face')
+        assert rv.status_code == 201
+
+        # search by a line of lyrics (chords are not part of the words)
+        rv = self.app.get('/api/v1/songs?query=troubles')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert [x['id'] for x in res['data']] == [song_id]
+
+        # search by author name and follow its change
+        rv = self.app.get('/api/v1/songs?query=McCartney')
+        res = json.loads(rv.data)
+        assert [x['id'] for x in res['data']] == [song_id]
+
+        rv = utils._put_author(self.app, author_id, name='John Lennon')
+        assert rv.status_code == 200
+
+        rv = self.app.get('/api/v1/songs?query=Lennon')
+        res = json.loads(rv.data)
+        assert [x['id'] for x in res['data']] == [song_id]
+
+        # title matches are ranked before lyrics matches
+        rv = self.app.get('/api/v1/songs?query=Kashmir%20far')
+        res = json.loads(rv.data)
+        assert len(res['data']) == 2 and res['data'][0]['title'] == 'Kashmir'
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_query_fuzzy(self):
+        rv = utils._post_song(self.app, title='Yesterday')
+        assert rv.status_code == 201
+        song_id = json.loads(rv.data)['id']
+
+        rv = utils._post_song(self.app, title='Kashmir')
+        assert rv.status_code == 201
+
+        # title with one wrong character is found
+        rv = self.app.get('/api/v1/songs?query=Yesteday&fuzzy=1')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert [x['id'] for x in res['data']] == [song_id]
+        assert int(res['count']) == 1
+
+        # renamed songs are found by their new title
+        rv = utils._put_song(self.app, song_id, title='Tomorrow')
+        assert rv.status_code == 200
+
+        rv = self.app.get('/api/v1/songs?query=Tomorow&fuzzy=1')
+        res = json.loads(rv.data)
+        assert [x['id'] for x in res['data']] == [song_id]
+
+        # unreachable songs are not returned
+        self._insert_song(1, PERMISSION.PRIVATE)
+        rv = self.app.get('/api/v1/songs?query=Nice%20sng&fuzzy=1')
+        res = json.loads(rv.data)
+        assert len(res['data']) == 0
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_query_reachable_cache(self):
+        rv = utils._post_song(self.app, title='Yesterday')
+        assert rv.status_code == 201
+        data = json.loads(rv.data)
+        song_id, variant_id = data['id'], data['variants'][0]['id']
+
+        # private variant changes version of its owner only
+        versions = {doc['_id']: doc['version'] for doc in self.mongo_db['versions'].find()}
+        assert 'reachable_songs' not in versions
+        assert len(versions) == 1
+
+        rv = self.app.get('/api/v1/songs?query=Yesteday&fuzzy=1')
+        assert [x['id'] for x in json.loads(rv.data)['data']] == [song_id]
+
+        # public song ids are invalidated once the variant gets public
+        rv = utils._put_song_variant(self.app, song_id, variant_id, visibility=PERMISSION.PUBLIC)
+        assert rv.status_code == 200
+        public = self.mongo_db['versions'].find_one({'_id': 'reachable_songs'})
+        assert public is not None
+
+        # other edits of the variant keep the cached values
+        rv = utils._put_song_variant(self.app, song_id, variant_id, text='[verse] Changed')
+        assert rv.status_code == 200
+        assert self.mongo_db['versions'].find_one({'_id': 'reachable_songs'}) == public
+
+        rv = self.app.get('/api/v1/songs?query=Yesteday&fuzzy=1')
+        assert [x['id'] for x in json.loads(rv.data)['data']] == [song_id]
+
+        # cached values are used without the database until they are invalidated
+        with mock.patch.object(
+                model.variants, '_find_distinct_song_ids',
+                wraps=model.variants._find_distinct_song_ids) as distinct:
+            rv = self.app.get('/api/v1/songs?query=Yesteday&fuzzy=1')
+            assert [x['id'] for x in json.loads(rv.data)['data']] == [song_id]
+            assert distinct.call_count == 0
+
+            rv = utils._put_song_variant(self.app, song_id, variant_id,
+                                         visibility=PERMISSION.PRIVATE)
+            assert rv.status_code == 200
+
+            rv = self.app.get('/api/v1/songs?query=Yesteday&fuzzy=1')
+            assert distinct.call_count == 2
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
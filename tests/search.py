@@ -0,0 +1,88 @@
+import unittest
+
+from bson import ObjectId
+
+from server.util.fuzzy import FuzzyIndex
+from server.util.search import SearchIndex
+from server.constants import PERMISSION
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def test_search_index(self):
+        index = SearchIndex()
+
+        song_id, other_song_id = ObjectId(), ObjectId()
+        variant_id, public_variant_id, other_variant_id = ObjectId(), ObjectId(), ObjectId()
+
+        index.add(variant_id, song_id, 'owner', PERMISSION.PRIVATE, {
+            'title': 'Zpívám si',
+            'names': 'Karel Kryl',
+            'text': 'Bratříčku zavírej vrátka'
+        })
+        index.add(public_variant_id, song_id, 'other', PERMISSION.PUBLIC, {
+            'title': 'Zpívám si',
+            'names': 'Karel Kryl',
+            'text': 'Jiná slova'
+        })
+        index.add(other_variant_id, other_song_id, 'other', PERMISSION.PRIVATE, {
+            'title': 'Jiná píseň',
+            'names': '',
+            'text': 'Zpívám'
+        })
+
+        # diacritics are ignored and title matches have higher score
+        assert index.search('zpivam', 'other') == {song_id: 10, other_song_id: 1}
+        assert index.search('ZPÍVÁM', 'nobody') == {song_id: 10}
+
+        # all words have to match, the last one is matched as a prefix
+        assert index.search('zavirej vra', 'owner') == {song_id: 2}
+        assert index.search('zavirej vra', 'other') == {}
+        assert index.search('bratr', 'owner') == {song_id: 1}
+        assert index.search('', 'owner') == {}
+
+        # song data are updated in all its variants
+        index.update_song(song_id, {'title': 'Nový název', 'names': 'Karel Kryl'})
+        assert index.search('novy', 'nobody') == {song_id: 10}
+        assert index.search('zpivam', 'nobody') == {}
+        assert index.get_title(song_id) == 'Nový název'
+
+        # variant text can be updated alone
+        index.add(public_variant_id, song_id, 'other', PERMISSION.PUBLIC, {'text': 'Úplně jiná'})
+        assert index.search('uplne', 'nobody') == {song_id: 1}
+        assert index.search('novy', 'nobody') == {song_id: 10}
+
+        # removed variants are not found
+        index.remove(variant_id)
+        index.remove(public_variant_id)
+        index.remove(other_variant_id)
+        assert len(index) == 0
+        assert index.search('kryl', 'owner') == {}
+
+    def test_fuzzy_index(self):
+        items = [(1, 'Yesterday'), (2, 'Kashmir'), (3, 'Zpívám si')]
+        index = FuzzyIndex(lambda: items)
+
+        # one wrong, missing or extra character is tolerated
+        assert list(index.search('Yesteday', 60)) == [1]
+        assert list(index.search('kashmr', 60)) == [2]
+        assert list(index.search('zpivam', 60)) == [3]
+        assert index.search('Yesterday', 60)[1] == 1.0
+        assert index.search('something else', 60) == {}
+
+        # one typo in short titles is tolerated as well
+        items.extend([(5, 'Numb'), (6, 'Rock'), (7, 'Help!'), (8, 'Hey Jude')])
+        index = FuzzyIndex(lambda: items)
+        assert list(index.search('Nunb', 60)) == [5]
+        assert list(index.search('Rokc', 60)) == [6]
+        assert list(index.search('Hepl', 60)) == [7]
+        assert list(index.search('Hlep', 60)) == [7]
+        assert list(index.search('Hey Jdue', 60)) == [8]
+        assert index.search('Hey Jdue', 60)[8] > 0.8
+        assert index.search('Nubm', 60) == {5: 0.75}
+
+        # changes are applied to the built index
+        index.add(4, 'Kashmir live')
+        index.remove(2)
+        assert list(index.search('kashmir', 60)) == [4]
+        assert index.get_text(4) == 'Kashmir live'
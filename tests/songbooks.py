@@ -2,11 +2,14 @@ import json
 import unittest
 import tests.utils as utils
 
+from unittest import mock
 from urllib.parse import urlsplit
 from bson import ObjectId
+from flask import g
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
 from server.constants import OPTIONS
 
 
@@ -22,11 +25,13 @@ class SongbookTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_songbook_basics(self):
         # check empty database get request
@@ -319,3 +324,71 @@ class SongbookTest(unittest.TestCase):
 
         # clean the database
         self.mongo_client.drop_database(self.db_name)
+
+    def test_songbook_summary(self):
+        rv = utils._post_songbook(self.app, title='Songbook')
+        assert rv.status_code == 201
+        songbook_id = json.loads(rv.data)['id']
+
+        rv = utils._post_song(self.app, title='Numb')
+        data = json.loads(rv.data)
+        song_id, variant_id = data['id'], data['variants'][0]['id']
+
+        rv = utils._put_songbook_songs(self.app, songbook_id, songs=[{'variant_id': variant_id}])
+        assert rv.status_code == 200
+
+        # extended songs are stored with the songbook
+        doc = self.mongo_db['songbooks'].find_one()
+        assert [x['variant_id'] for x in doc['summary']] == [variant_id]
+
+        # changes of songs and variants are propagated into the stored songs
+        rv = utils._put_song(self.app, song_id, title='Given Up')
+        assert rv.status_code == 200
+        rv = utils._put_song_variant(self.app, song_id, variant_id, variant_title='Live')
+        assert rv.status_code == 200
+
+        rv = self.app.get('/api/v1/songbooks')
+        res = json.loads(rv.data)
+        assert rv.status_code == 200
+        assert res['data'][0]['songs'][0]['song']['title'] == 'Given Up'
+        assert res['data'][0]['songs'][0]['title'] == 'Live'
+
+        # list representation matches the full one
+        rv = self.app.get('/api/v1/songbooks/{}'.format(songbook_id))
+        assert json.loads(rv.data)['songs'] == res['data'][0]['songs']
+
+        rv = utils._post_songbook(self.app, title='Other songbook')
+        assert rv.status_code == 201
+        other_id = json.loads(rv.data)['id']
+
+        with app.app_context():
+            g.model = model
+            songbook = model.songbooks.find_one(songbook_id=songbook_id)
+            other = model.songbooks.find_one(songbook_id=other_id)
+            variant = model.variants.find_one(variant_id=variant_id)
+
+            # summaries are not updated when the stored data did not change
+            with mock.patch.object(model.songbooks._collection, 'update_many') as update_many:
+                variant.set_data({'text': '[verse] Changed text'})
+                model.variants.save(variant)
+                assert update_many.call_count == 0
+
+            # only songbooks containing the variant are discarded from the identity map
+            variant.set_data({'title': 'Studio'})
+            model.variants.save(variant)
+            assert model.songbooks.find_one(songbook_id=other_id) is other
+            songbook = model.songbooks.find_one(songbook_id=songbook_id)
+            assert songbook.get_serialized_summary()['songs'][0]['title'] == 'Studio'
+
+            # up to date summaries are neither modified nor discarded
+            model.songbooks.update_summary_variant(variant)
+            assert model.songbooks.find_one(songbook_id=songbook_id) is songbook
+            assert model.songbooks.find_one(songbook_id=other_id) is other
+
+        # deleted variants are removed from the stored songs
+        rv = self.app.delete('/api/v1/songs/{}/variants/{}'.format(song_id, variant_id))
+        assert rv.status_code == 204
+        assert self.mongo_db['songbooks'].find_one()['summary'] == []
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
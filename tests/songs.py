@@ -2,10 +2,14 @@ import json
 import unittest
 import tests.utils as utils
 
+from unittest import mock
 from urllib.parse import urlsplit
+from flask import g
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
+from server.util.identity import clear_identity_map
 
 
 class SongTest(unittest.TestCase):
@@ -20,11 +24,13 @@ class SongTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_song_basics(self):
         # check empty database get request
@@ -282,6 +288,83 @@ class SongTest(unittest.TestCase):
         # clean the database
         self.mongo_client.drop_database(self.db_name)
 
+    def test_song_streaming(self):
+        rv = utils._post_song(self.app, title='Live and Let Die')
+        assert rv.status_code == 201
+        rv = utils._post_song(self.app, title='Kashmir')
+        assert rv.status_code == 201
+
+        # get songs as one json record per line
+        rv = self.app.get('/api/v1/songs?order=title', headers={'Accept': 'application/x-ndjson'})
+        assert rv.status_code == 200
+        assert rv.mimetype == 'application/x-ndjson'
+
+        res = [json.loads(line) for line in rv.data.decode('utf8').splitlines()]
+        assert len(res) == 2
+        assert res[0]['title'] == 'Kashmir' and res[1]['title'] == 'Live and Let Die'
+        assert len(res[0]['variants']) == 1
+
+        # variants are streamed together with their song data
+        rv = self.app.get('/api/v1/variants?order=title',
+                          headers={'Accept': 'application/x-ndjson'})
+        assert rv.status_code == 200
+
+        res = [json.loads(line) for line in rv.data.decode('utf8').splitlines()]
+        assert len(res) == 2
+        assert res[0]['song']['title'] == 'Kashmir'
+
+        # paging works the same way as in the standard response
+        rv = self.app.get('/api/v1/songs?order=title&per_page=1&page=1',
+                          headers={'Accept': 'application/x-ndjson'})
+        res = [json.loads(line) for line in rv.data.decode('utf8').splitlines()]
+        assert len(res) == 1 and res[0]['title'] == 'Live and Let Die'
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_song_identity_map(self):
+        rv = utils._post_song(self.app, title='Kashmir')
+        assert rv.status_code == 201
+        song_id = json.loads(rv.data)['id']
+
+        with app.app_context():
+            g.model = model
+
+            # song is loaded from the database only once per request
+            song = model.songs.find_one(song_id=song_id)
+            assert model.songs.find_one(song_id=song_id) is song
+            assert model.songs.find_one(title='Kashmir') is song
+            assert g.identity_map.hits == 1
+
+            # saved song is loaded again
+            song.set_data({'title': 'Yesterday'})
+            model.songs.save(song)
+            assert model.songs.find_one(song_id=song_id) is not song
+            assert model.songs.find_one(song_id=song_id).get_title() == 'Yesterday'
+
+            # search data of variants are updated only after changes of searched fields
+            song = model.songs.find_one(song_id=song_id)
+            with mock.patch.object(model.variants, 'update_search') as update_search:
+                model.songs.save(song)
+                assert update_search.call_count == 0
+
+                song.set_data({'title': 'Tomorrow'})
+                model.songs.save(song)
+                assert update_search.call_count == 1
+
+                model.songs.save(song)
+                assert update_search.call_count == 1
+
+            # cleared map starts anew (e.g. for the next export job)
+            song = model.songs.find_one(song_id=song_id)
+            assert clear_identity_map() is not None
+            assert 'identity_map' not in g
+            assert model.songs.find_one(song_id=song_id) is not song
+            assert g.identity_map.hits == 0
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
     def test_authors_and_interpreters(self):
         # insert test author for further testing
         rv = utils._post_author(self.app, name='Axl Rose')
@@ -1,3 +1,5 @@
+import os
+import time
 import unittest
 
 from server.util import translate_to_tex
@@ -24,7 +26,10 @@ class TranslatorTest(unittest.TestCase):
             "[solo]\n[C] [Em] [Bb] [A]\n[G] [Gb] The [F]sky is a neighborhood",
             "[verse]\nStíny [E]dnů a snů se k obratníku [A]stáčí\nRuce [E]snů černejch se snaží zakrýt [A]oči\nSvětlo [F#mi]tvý prozradí proč já [E]vím\nS novým [F#mi]dnem že se [A]zas navrá[H]tí",
             "[Chorus]\n[E]Jenže tenhle zlej mě [A]strejda vyčítá,\n[G]že se mu to taky blbě [B]počítá.\n|:Ale já [Emi]výlevy a provokace\nzavostalý generace [A]nevydejchám, [Ami]nevydejchám.:|",
-            "[verse]\n.,:?!+#\"()[]|'-"
+            "[verse]\n.,:?!+#\"()[]|'-",
+            "[chorus]\n|:Ale já [Emi]výlevy a \"provokace\"\n"
+            "zavostalý generace [A]nevydejchám, [Ami]nevydejchám.:|2\n"
+            "[rec]Caught in the undertow, just caught in the undertow\n"
         ]
 
         for song in wrong_format:
@@ -35,3 +40,23 @@ class TranslatorTest(unittest.TestCase):
         for song in correct_format:
             _, log = translate_to_tex(song)
             assert log == "", "Log found where it shouldn't:\nText:\n{}\nLog:\n{}".format(song, log)
+
+    # benchmark is slow and prints its result, it is run only on demand
+    @unittest.skipUnless(os.getenv('TRANSLATOR_BENCHMARK'), 'set TRANSLATOR_BENCHMARK to run')
+    def test_translator_benchmark(self):
+        song = "[verse]\nStíny [E]dnů a snů se k obratníku [A]stáčí\n" \
+               "Ruce [E]snů černejch se snaží zakrýt [A]oči\n" \
+               "Světlo [F#mi]tvý prozradí proč já [E]vím\n" \
+               "S novým [F#mi]dnem že se [A]zas navrá[H]tí\n" \
+               "[chorus]\n|:Ale já [Emi]výlevy a \"provokace\"\n" \
+               "zavostalý generace [A]nevydejchám, [Ami]nevydejchám.:|2\n" \
+               "[rec]Caught in the undertow, just caught in the undertow\n"
+        songs = [song * 4] * 2000
+
+        start = time.perf_counter()
+        for text in songs:
+            _, log = translate_to_tex(text)
+            assert log == "", "Log found where it shouldn't:\nText:\n{}\nLog:\n{}".format(text, log)
+        duration = time.perf_counter() - start
+
+        print('\nTranslator throughput: {:.0f} songs per second'.format(len(songs) / duration))
@@ -5,6 +5,7 @@ from urllib.parse import urlsplit
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
 
 
 class UserTest(unittest.TestCase):
@@ -19,11 +20,13 @@ class UserTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_user_basics(self):
         # check user info
@@ -64,3 +67,30 @@ class UserTest(unittest.TestCase):
         # check nonexisting user
         rv = self.app.get('/api/v1/users/{}'.format(1002))
         assert rv.status_code == 404
+
+    def test_user_cache(self):
+        # cache is tested with its default age regardless of the configuration
+        ttl = app.config['USER_CACHE_TTL']
+        app.config['USER_CACHE_TTL'] = 60
+        try:
+            with app.app_context():
+                # logged-in user is loaded from the database only once
+                model.users.clear_cache()
+                user = model.users.find(0)
+                assert model.users.find(0) is user
+
+                self.mongo_db['users'].update_one({'_id': 0}, {'$set': {'name': 'Changed'}})
+                assert model.users.find(0).get_name() == 'Test'
+
+                # saved user is loaded again
+                user.set_token(None)
+                model.users.save(user)
+                assert model.users.find(0) is not user
+                assert model.users.find(0).get_token() is None
+
+                # cleared cache does not return users from the dropped database
+                self.mongo_client.drop_database(self.db_name)
+                model.users.clear_cache()
+                assert model.users.find(0) is None
+        finally:
+            app.config['USER_CACHE_TTL'] = ttl
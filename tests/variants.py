@@ -2,11 +2,18 @@ import json
 import unittest
 import tests.utils as utils
 
+from unittest import mock
 from urllib.parse import urlsplit
+from flask import g
 from pymongo import MongoClient
 
 from server.app import app
+from server.app import model
+from server.util import AppException
+from server.util.prewarm import prewarm_export_caches
+from server.constants import EXCODES
 from server.constants import PERMISSION
+from server.constants import STRINGS
 
 
 class SongVariantTest(unittest.TestCase):
@@ -21,11 +28,13 @@ class SongVariantTest(unittest.TestCase):
         self.mongo_db = self.mongo_client[self.db_name]
 
         # login into the application via test login endpoint
+        model.users.clear_cache()
         self.app.get('/test_login')
 
     def tearDown(self):
-        # delete all test database entries
+        # delete all test database entries (and users cached by the application)
         self.mongo_client.drop_database(self.db_name)
+        model.users.clear_cache()
 
     def test_song_variant_basics(self):
         # add test song into the database
@@ -299,3 +308,194 @@ class SongVariantTest(unittest.TestCase):
 
         # clean the database
         self.mongo_client.drop_database(self.db_name)
+
+    def test_batch_validation(self):
+        texts = ['[verse]\nThe sky is a [Em]neighborhood', 'Toto je nas skautsky zpevnik',
+                 '[verse] To catch them is my * real test']
+
+        # validate texts
+        rv = self.app.post(
+            '/api/v1/variants/validate',
+            content_type='application/json',
+            data=json.dumps({'texts': texts}))
+        assert rv.status_code == 200
+
+        res = json.loads(rv.data)
+        assert [item['index'] for item in res] == [0, 1, 2]
+        assert res[0]['log'] == ''
+        assert res[1]['log'] == STRINGS.TRANSLATOR.ERROR_NO_STARTING_BLOCK
+        assert res[2]['log'] == STRINGS.TRANSLATOR.ERROR_STRING_CONTAINS_FORBIDDEN_CHARACTERS
+
+        # validate large batch with streamed response
+        rv = self.app.post(
+            '/api/v1/variants/validate',
+            content_type='application/json',
+            headers={'Accept': 'application/x-ndjson'},
+            data=json.dumps({'texts': texts * 100}))
+        assert rv.status_code == 200
+
+        res = [json.loads(line) for line in rv.data.decode('utf8').splitlines()]
+        assert sorted(item['index'] for item in res) == list(range(300))
+        for item in res:
+            if item['index'] % 3 == 0:
+                assert item['log'] == ''
+            else:
+                assert item['log'] != ''
+
+        # test missing texts
+        rv = self.app.post(
+            '/api/v1/variants/validate',
+            content_type='application/json',
+            data=json.dumps({'text': 'text'}))
+        assert rv.status_code == 422
+        assert b'"code":"missing_field"' in rv.data
+
+    def test_export_caches(self):
+        rv = utils._post_interpreter(self.app, name='Linkin Park')
+        assert rv.status_code == 201
+        interpreter_id = json.loads(rv.data)['link'].split('/')[1]
+
+        song_ids, variant_ids = [], []
+        for title in ('Numb', 'Given Up'):
+            rv = utils._post_song(
+                self.app, title=title, text='[verse] Text', interpreters=[interpreter_id])
+            assert rv.status_code == 201
+            song_ids.append(json.loads(rv.data)['id'])
+            variant_ids.append(json.loads(rv.data)['variants'][0]['id'])
+
+        with app.app_context():
+            g.model = model
+
+            # export caches of all variants are filled at once
+            variants = [model.variants.find_one(variant_id=x) for x in variant_ids]
+            model.variants.fill_export_caches(variants)
+
+            for variant in variants:
+                assert variant.get_export_cache()['interpreters'] == ['Linkin Park']
+
+        # export caches are saved into the database
+        for doc in self.mongo_db['variants'].find():
+            assert doc['export_cache']['title'] in ('Numb', 'Given Up')
+            assert '\\beginverse' in doc['export_cache']['song']
+
+        # export caches are cleared by one update for the edited song
+        rv = utils._put_song(self.app, song_ids[0], title='Numb', interpreters=[interpreter_id])
+        assert rv.status_code == 200
+        assert self.mongo_db['variants'].count_documents({'export_cache': None}) == 1
+
+        with app.app_context():
+            assert model.variants.invalidate_cache_for_song(song_ids[0]) == 0
+            assert model.variants.invalidate_all() == 1
+
+        # missing songs and malformed (or missing) interpreter ids are reported
+        self.mongo_db['songs'].update_one({'title': 'Numb'}, {'$set': {'interpreters': ['x']}})
+        self.mongo_db['songs'].delete_one({'title': 'Given Up'})
+
+        for index, message in enumerate(
+            (STRINGS.INTERPRETER_NOT_FOUND_ERROR, STRINGS.SONG_NOT_FOUND_ERROR)):
+            with app.app_context():
+                g.model = model
+                variant = model.variants.find_one(variant_id=variant_ids[index])
+
+                with self.assertRaises(AppException) as context:
+                    model.variants.fill_export_caches([variant])
+                assert context.exception.status_code == 404
+                assert context.exception.get_exception()[0]['code'] == EXCODES.DOES_NOT_EXIST
+                assert context.exception.get_exception()[0]['message'] == message
+
+        # broken variants are skipped in lenient mode
+        with app.app_context():
+            g.model = model
+            variants = [model.variants.find_one(variant_id=x) for x in variant_ids]
+            assert model.variants.fill_export_caches(variants, strict=False) == 0
+
+            self.mongo_db['songs'].update_one({'title': 'Numb'}, {'$set': {'interpreters': []}})
+            assert model.variants.fill_export_caches(variants, strict=False) == 1
+            assert variants[0].get_export_cache()['interpreters'] == []
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_export_caches_prewarm(self):
+        for title in ('Numb', 'Given Up'):
+            rv = utils._post_song(self.app, title=title, text='[verse] Text')
+            assert rv.status_code == 201
+
+        # one of the variants cannot be translated
+        self.mongo_db['variants'].update_one({}, {'$set': {'text': '[verse] Text @'}})
+
+        with app.app_context():
+            g.model = model
+            assert model.variants.count_uncached() == 2
+
+            # uncached variants are found in batches and broken ones are skipped
+            batches = list(model.variants.find_uncached(batch_size=1))
+            assert [len(batch) for batch in batches] == [1, 1]
+            assert sum(model.variants.fill_export_caches(x, strict=False) for x in batches) == 1
+
+            assert model.variants.count_uncached() == 1
+            assert model.variants.count_uncached(public_only=True) == 0
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)
+
+    def test_export_caches_prewarm_pool(self):
+        for i in range(6):
+            rv = utils._post_song(self.app, title='Song {}'.format(i), text='[verse] Text')
+            assert rv.status_code == 201
+
+        # only public variants are prewarmed, one of them cannot be translated
+        self.mongo_db['variants'].update_many({}, {'$set': {'visibility': PERMISSION.PUBLIC}})
+        self.mongo_db['variants'].update_one({}, {'$set': {'text': '[verse] Text @'}})
+
+        class SyncPool(object):
+            """Pool running tasks once their results are requested."""
+
+            def __init__(self, initializer):
+                initializer()
+                self.pending = 0
+                self.max_pending = 0
+
+            def apply_async(self, function, args):
+                self.pending += 1
+                self.max_pending = max(self.max_pending, self.pending)
+                pool = self
+
+                class Result(object):
+
+                    def get(self):
+                        pool.pending -= 1
+                        return function(*args)
+
+                return Result()
+
+        pools = []
+
+        def _get_pool(name, processes, initializer=None):
+            assert name == 'prewarm'
+            pools.append(SyncPool(initializer))
+            return pools[-1]
+
+        config = {'PREWARM_WORKERS': 1, 'PREWARM_BATCH_SIZE': 1, 'PREWARM_THROTTLE': 0.5}
+        original = {key: app.config[key] for key in config}
+        app.config.update(config)
+        try:
+            with app.app_context(), \
+                    mock.patch('server.util.prewarm.get_pool', _get_pool), \
+                    mock.patch('server.util.prewarm.time.sleep') as sleep:
+                g.model = model
+                assert prewarm_export_caches(public_only=True) == (6, 5)
+        finally:
+            app.config.update(original)
+
+        # at most two batches per worker are queued at once
+        assert pools[0].max_pending == 2
+
+        # workers rest after every batch
+        assert sleep.call_count == 6
+
+        # all variants except the broken one are cached
+        assert self.mongo_db['variants'].count_documents({'export_cache': None}) == 1
+
+        # clean the database
+        self.mongo_client.drop_database(self.db_name)